@@ -1,3 +1,5 @@
+require "json"
+
 module Jekyll
     module OpenTTDFilters
 
@@ -8,6 +10,15 @@ module Jekyll
         def startswith(text, query)
             return text.start_with? query
           end
+
+        # Load the shard of the version of a summary page (see analysis/shards.py), or nil if it is not sharded.
+        # Shards live outside of _data, so only the shards of pages being built are loaded.
+        def summary_shard(page)
+            site = @context.registers[:site]
+            filename = File.join(site.source, "_shards", page["year"], page["filename"], "#{page["version"]}.json")
+            return nil unless File.exist?(filename)
+            return JSON.parse(File.read(filename))
+        end
     end
 end
 
@@ -0,0 +1,170 @@
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial as bind
+
+from .content import export_bananas_data, import_bananas_usage
+from .finalize import finalize_summary
+from .merge import merge_summary
+from .options import add_summary_arguments, apply_summary_arguments, get_worker_options
+from .sample import export_sample, get_sample_rate, pop_effective_surveys
+from .state import AtomicFile
+from .store import export_summary, new_summary
+from .summarize import summarize_partial_timeframes
+
+# Kinds of buckets, with the timeframe that decides how versions are reported in them.
+BUCKET_TIMEFRAMES = {
+    "week": "wk",
+    "month": "wk",
+    "quarter": "q",
+}
+# Kinds of buckets created by default; the site has no page for a month, so those are only created when asked for.
+DEFAULT_BUCKETS = ["week", "quarter"]
+
+ARCHIVE_DATE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+class Bucket:
+    # A period to create a summary for, like a week; "name" is also where it is written to, like "2024/wk09".
+
+    __slots__ = ("kind", "name", "start", "end")
+
+    def __init__(self, kind, name, start, end):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = end
+
+    @property
+    def timeframe(self):
+        return BUCKET_TIMEFRAMES[self.kind]
+
+
+def get_archive_date(filename):
+    # Survey packs are daily, and named after the day they cover, like "openttd-survey-pack.2024-03-01.tar.xz".
+    match = ARCHIVE_DATE.search(os.path.basename(filename))
+    if match is None:
+        raise Exception(f"Cannot find the date of {filename}")
+
+    return datetime.date(*map(int, match.groups()))
+
+
+def get_bucket(kind, date):
+    if kind == "week":
+        year, week, weekday = date.isocalendar()
+        start = date - datetime.timedelta(days=weekday - 1)
+        return Bucket(kind, f"{year}/wk{week:02d}", start, start + datetime.timedelta(days=6))
+
+    if kind == "month":
+        start = date.replace(day=1)
+        end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+        return Bucket(kind, f"{date.year}/m{date.month:02d}", start, end)
+
+    if kind == "quarter":
+        quarter = (date.month - 1) // 3 + 1
+        start = date.replace(month=(quarter - 1) * 3 + 1, day=1)
+        end = (start + datetime.timedelta(days=92)).replace(day=1) - datetime.timedelta(days=1)
+        return Bucket(kind, f"{date.year}/q{quarter}", start, end)
+
+    raise Exception(f"Unknown bucket: {kind}")
+
+
+def _summarize_archives(timeframes, filenames, jobs):
+    summarize = bind(summarize_partial_timeframes, timeframes)
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, **get_worker_options()) as executor:
+            # Results are returned in the order of the filenames, so every bucket is identical to a run over
+            # just the archives in it.
+            yield from executor.map(summarize, filenames)
+    else:
+        yield from map(summarize, filenames)
+
+
+def summarize_buckets(filenames, kinds, jobs=1):
+    # Summarize every archive once, and merge the result into each bucket (of the given kinds) its date falls in.
+    # Returns per bucket name: the bucket, its summary, the content it uses, and the dates it has archives of.
+    timeframes = list(dict.fromkeys(BUCKET_TIMEFRAMES[kind] for kind in kinds))
+    buckets = {}
+
+    for filename, (partials, usage) in zip(filenames, _summarize_archives(timeframes, filenames, jobs)):
+        date = get_archive_date(filename)
+        import_bananas_usage(usage)
+
+        for kind in kinds:
+            bucket = get_bucket(kind, date)
+            if bucket.name not in buckets:
+                buckets[bucket.name] = (bucket, new_summary(), {content_type: {} for content_type in usage}, set())
+            _, summary, bucket_usage, dates = buckets[bucket.name]
+
+            merge_summary(summary, partials[bucket.timeframe])
+            for content_type, content_ids in usage.items():
+                bucket_usage[content_type].update(dict.fromkeys(content_ids))
+            dates.add(date)
+
+    return buckets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.buckets",
+        description="Summarize survey packs into every week and quarter (or month) they cover, reading each pack once.",
+    )
+    parser.add_argument("filenames", nargs="+", help="Daily survey packs (tar.xz) or columnar packs.")
+    parser.add_argument(
+        "--buckets",
+        nargs="+",
+        choices=list(BUCKET_TIMEFRAMES),
+        default=DEFAULT_BUCKETS,
+        help=f"Kinds of summaries to create (default: {' '.join(DEFAULT_BUCKETS)}).",
+    )
+    parser.add_argument(
+        "--output", metavar="DIR", default="_data/summaries", help="Where to write the summaries to, as <year>/<name>."
+    )
+    parser.add_argument(
+        "--partial", action="store_true", help="Also write summaries for which not every day has a pack."
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Amount of archives to summarize in parallel (default: 1)."
+    )
+    add_summary_arguments(parser)
+    args = parser.parse_intermixed_args()
+
+    apply_summary_arguments(args)
+    sample_rate = get_sample_rate()
+
+    buckets = summarize_buckets(args.filenames, args.buckets, args.jobs)
+
+    for bucket, summary, usage, dates in buckets.values():
+        days = (bucket.end - bucket.start).days + 1
+        if len(dates) != days and not args.partial:
+            print(f"Skipping {bucket.name}: only {len(dates)} of {days} days have a pack", file=sys.stderr)
+            continue
+
+        summary = export_summary(summary)
+        if sample_rate < 1:
+            effective = pop_effective_surveys(summary)
+
+        summary = {
+            "survey": finalize_summary(summary),
+            "content": export_bananas_data({content_type: list(used) for content_type, used in usage.items()}),
+        }
+        if sample_rate < 1:
+            summary["sample"] = export_sample(summary["survey"], effective)
+
+        filename = os.path.join(args.output, f"{bucket.name}.json")
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with AtomicFile(filename) as fp:
+            fp.write(json.dumps(summary, indent=2))
+            fp.write("\n")
+
+        print(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import json
+import os
+
+from .content import get_bananas_revision
+from .crosstab import get_crosstabs
+from .distinct import get_distinct_mode
+from .objects import is_object_directory
+from .s3 import get_s3_object, is_s3_url
+from .sample import get_sample_rate
+from .state import decode_summary, encode_summary, write_json
+from .stats import count
+from .summarize import summarize_partial
+
+# Increase this whenever the way a survey is summarized changes; this invalidates all existing cache files.
+CACHE_FORMAT = 2
+
+
+def _get_cache_key(timeframe, filename):
+    if is_s3_url(filename):
+        # Don't download the archive just to find out it didn't change; S3 already knows.
+        size, etag = get_s3_object(filename)
+        return {
+            "format": CACHE_FORMAT,
+            "timeframe": timeframe,
+            "distinct": get_distinct_mode(),
+            "crosstabs": [list(paths) for paths in get_crosstabs()],
+            "sample": get_sample_rate(),
+            # Content is resolved against BaNaNaS while summarizing, like the version of a NewGRF.
+            "bananas": get_bananas_revision(),
+            "size": size,
+            "etag": etag,
+        }
+
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        while chunk := fp.read(1024 * 1024):
+            sha256.update(chunk)
+
+    # Packs are downloaded fresh for every run, so the modification time can't be trusted; use the content instead.
+    return {
+        "format": CACHE_FORMAT,
+        "timeframe": timeframe,
+        "distinct": get_distinct_mode(),
+        "crosstabs": [list(paths) for paths in get_crosstabs()],
+        "sample": get_sample_rate(),
+        "bananas": get_bananas_revision(),
+        "size": os.path.getsize(filename),
+        "sha256": sha256.hexdigest(),
+    }
+
+
+def summarize_cached(timeframe, filename, cache_dir):
+    # Summarize a single archive, reusing the result of an earlier run if the archive didn't change.
+    if is_object_directory(filename):
+        # A directory of objects (see analysis.objects) changes all the time; only what is new is read anyway.
+        return summarize_partial(timeframe, filename)
+
+    cache_filename = os.path.join(cache_dir, f"{os.path.basename(filename)}.{timeframe}.json.gz")
+    key = _get_cache_key(timeframe, filename)
+
+    if os.path.exists(cache_filename):
+        with gzip.open(cache_filename, "rt") as fp:
+            cache = json.load(fp)
+
+        if cache["key"] == key:
+            count("archives")
+            count("archives_cached")
+            return decode_summary(cache["summary"]), cache["content"]
+
+    partial, usage = summarize_partial(timeframe, filename)
+
+    cache = {
+        "key": key,
+        "summary": encode_summary(partial),
+        "content": usage,
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    write_json(cache_filename, cache, compress=True)
+
+    return partial, usage
@@ -0,0 +1,278 @@
+import gzip
+import json
+
+from array import array
+from collections import defaultdict
+
+from .content import import_bananas_usage
+from .crosstab import get_crosstab_path, get_crosstab_value, get_crosstabs
+from .distinct import decode_array, encode_array, new_distinct
+from .merge import CONTENT_PREFIXES, merge_summary
+from .sample import SAMPLE_PATH, get_minutes_squared, get_sample_rate, is_sampled
+from .state import write_json
+from .stats import count
+from .timeframe import get_timeframe_version
+
+# Suffix of a columnar pack, as created by "python -m analysis.convert".
+COLUMNS_SUFFIX = ".columns.gz"
+# Increase this whenever the layout of a columnar pack changes.
+COLUMNS_FORMAT = 1
+
+
+class Column:
+    # Everything counted for a single path. Per count, the row (accepted survey result) it belongs to, its position
+    # in the order things were counted in, and the value, as index in "values".
+    # "kind" is either "seconds" (the seconds of the row are counted) or "count" (every row counts as one).
+
+    __slots__ = ("kind", "values", "rows", "positions", "codes")
+
+    def __init__(self, kind, values=None, rows=None, positions=None, codes=None):
+        self.kind = kind
+        self.values = [] if values is None else values
+        self.rows = array("I") if rows is None else rows
+        self.positions = array("I") if positions is None else positions
+        self.codes = array("I") if codes is None else codes
+
+    def __iter__(self):
+        # Iterate over (row, value) of every count.
+        values = self.values
+        for row, code in zip(self.rows, self.codes):
+            yield row, values[code]
+
+
+class Columns:
+    # A survey pack, as a table with a row per accepted survey result, and a column per path.
+
+    def __init__(self):
+        self.seconds = array("q")
+        self.ticks = array("q")
+        self.schemas = array("B")
+        self.versions = []
+        self.version_codes = array("I")
+        self.session_ids = []
+        self.paths = {}
+        self.content = {}
+
+        self._version_lookup = {}
+        self._value_lookup = {}
+        self._position = 0
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def add_row(self, seconds, ticks, schema, version, session_id, counts):
+        # Add an accepted survey result, with everything it counted as (path, value, amount).
+        row = len(self.seconds)
+
+        self.seconds.append(seconds)
+        self.ticks.append(ticks)
+        self.schemas.append(schema)
+        self.session_ids.append(session_id)
+
+        version_code = self._version_lookup.get(version)
+        if version_code is None:
+            version_code = self._version_lookup[version] = len(self.versions)
+            self.versions.append(version)
+        self.version_codes.append(version_code)
+
+        for path, value, amount in counts:
+            if amount == seconds:
+                kind = "seconds"
+            elif amount == 1:
+                kind = "count"
+            else:
+                raise Exception(f"Cannot store an amount of {amount} for {path}")
+
+            column = self.paths.get(path)
+            if column is None:
+                column = self.paths[path] = Column(kind)
+                self._value_lookup[path] = {}
+            elif column.kind != kind:
+                raise Exception(f"Path {path} is counted both by seconds and by survey result")
+
+            lookup = self._value_lookup[path]
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(column.values)
+                column.values.append(value)
+
+            column.rows.append(row)
+            column.positions.append(self._position)
+            column.codes.append(code)
+            self._position += 1
+
+    def save(self, filename):
+        data = {
+            "format": COLUMNS_FORMAT,
+            "content": self.content,
+            "rows": {
+                "seconds": encode_array(self.seconds),
+                "ticks": encode_array(self.ticks),
+                "schemas": encode_array(self.schemas),
+                "versions": self.versions,
+                "version_codes": encode_array(self.version_codes),
+                "session_ids": self.session_ids,
+            },
+            "paths": {
+                path: {
+                    "kind": column.kind,
+                    # A list (unlike the keys of an object) keeps the type of the values intact.
+                    "values": column.values,
+                    "rows": encode_array(column.rows),
+                    "positions": encode_array(column.positions),
+                    "codes": encode_array(column.codes),
+                }
+                for path, column in self.paths.items()
+            },
+        }
+        write_json(filename, data, compress=True)
+
+
+def load_columns(filename):
+    with gzip.open(filename, "rt") as fp:
+        data = json.load(fp)
+
+    if data["format"] != COLUMNS_FORMAT:
+        raise Exception(f"Columnar pack {filename} has format {data['format']}, expected {COLUMNS_FORMAT}")
+
+    columns = Columns()
+    columns.content = data["content"]
+
+    rows = data["rows"]
+    columns.seconds = decode_array("q", rows["seconds"])
+    columns.ticks = decode_array("q", rows["ticks"])
+    columns.schemas = decode_array("B", rows["schemas"])
+    columns.versions = rows["versions"]
+    columns.version_codes = decode_array("I", rows["version_codes"])
+    columns.session_ids = rows["session_ids"]
+
+    for path, column in data["paths"].items():
+        columns.paths[path] = Column(
+            column["kind"],
+            column["values"],
+            decode_array("I", column["rows"]),
+            decode_array("I", column["positions"]),
+            decode_array("I", column["codes"]),
+        )
+
+    return columns
+
+
+def _get_row_values(columns, path):
+    # Per row, the value of a path (the last one, if counted more than once), as count_crosstabs would see it.
+    if path == "info.openttd.version":
+        # Cross-tabulations use the original version, also when the summary combines versions.
+        return [columns.versions[code] for code in columns.version_codes]
+
+    values = [None] * len(columns)
+    column = columns.paths.get(path)
+    if column is not None:
+        for row, value in column:
+            values[row] = value
+    return values
+
+
+def _count_crosstabs(columns, row_versions, partial):
+    # The same as summarize.count_crosstabs, but for all rows at once.
+    crosstabs = get_crosstabs()
+    row_values = {path: _get_row_values(columns, path) for paths in crosstabs for path in paths}
+
+    for paths in crosstabs:
+        crosstab_path = get_crosstab_path(paths)
+        path_values = [row_values[path] for path in paths]
+
+        for row, version in enumerate(row_versions):
+            if version is None:
+                continue
+
+            values = [values[row] for values in path_values]
+            if None in values:
+                continue
+
+            data = partial.setdefault(version, {}).setdefault(crosstab_path, {})
+            value = get_crosstab_value(values)
+            data[value] = data.get(value, 0) + columns.seconds[row]
+
+
+def summarize_columns(summary, timeframe, filename):
+    # Summarize a columnar pack; the result is identical to summarizing the survey pack it was converted from.
+    columns = load_columns(filename)
+    # Content usage is stored per pack, not per row; with "--sample", the names of content only used by sessions
+    # outside the sample are exported too. That is harmless, as these names are only looked up by what was counted.
+    import_bananas_usage(columns.content)
+
+    count("archives")
+
+    seconds = columns.seconds
+    versions = [get_timeframe_version(timeframe, version) for version in columns.versions]
+    row_versions = [versions[code] for code in columns.version_codes]
+
+    sample_rate = get_sample_rate()
+    if sample_rate < 1:
+        # Rows of sessions outside the sample get no version, so they are skipped below.
+        for row, session_id in enumerate(columns.session_ids):
+            if not is_sampled(session_id):
+                row_versions[row] = None
+                count("rejected.sampled-out")
+    count("accepted", len(row_versions) - row_versions.count(None))
+
+    # Per version, the paths with the position they were first counted at, so they can be put in that order.
+    paths = defaultdict(list)
+
+    for path, column in columns.paths.items():
+        by_seconds = column.kind == "seconds"
+        # For content, "(unknown)" only records the highest value (see content._count).
+        unknown = -1
+        if path.startswith(CONTENT_PREFIXES) and "(unknown)" in column.values:
+            unknown = column.values.index("(unknown)")
+
+        path_versions = {}
+        for row, position, code in zip(column.rows, column.positions, column.codes):
+            version = row_versions[row]
+            if version is None:
+                continue
+
+            data = path_versions.get(version)
+            if data is None:
+                data = path_versions[version] = {}
+                paths[version].append((position, path, data))
+
+            amount = seconds[row] if by_seconds else 1
+            if code == unknown:
+                data[code] = max(data.get(code, 0), amount)
+            else:
+                data[code] = data.get(code, 0) + amount
+
+    partial = {}
+    for version, version_paths in paths.items():
+        version_paths.sort()
+        partial[version] = {
+            path: {columns.paths[path].values[code]: amount for code, amount in data.items()}
+            for _, path, data in version_paths
+        }
+
+    if get_crosstabs():
+        _count_crosstabs(columns, row_versions, partial)
+
+    for row, version in enumerate(row_versions):
+        if version is None:
+            continue
+        version_partial = partial.setdefault(version, {})
+
+        if "summary" not in version_partial:
+            version_partial["summary"] = {"count": 0, "seconds": 0, "ids": new_distinct()}
+        version_partial["summary"]["count"] += 1
+        version_partial["summary"]["seconds"] += seconds[row]
+        version_partial["summary"]["ids"].add(columns.session_ids[row])
+
+        # Quarterly reports are combined per major version; also show the relative usage of versions.
+        if timeframe == "q":
+            original_version = columns.versions[columns.version_codes[row]]
+            data = version_partial.setdefault("info.openttd.version", {})
+            data[original_version] = data.get(original_version, 0) + seconds[row]
+
+        if sample_rate < 1:
+            data = version_partial.setdefault(SAMPLE_PATH, {})
+            data["minutes_squared"] = data.get("minutes_squared", 0) + get_minutes_squared(seconds[row])
+
+    merge_summary(summary, partial)
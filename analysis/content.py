@@ -1,21 +1,43 @@
+import argparse
 import glob
+import json
 import os
 import yaml
 
+from contextlib import contextmanager
+
+from .normalize import normalizer
+from .state import write_json
+from .stats import count
+from .store import intern_cell
+
+# Index of the BaNaNaS checkout, as created by "python -m analysis.content build-index".
+BANANAS_INDEX_FILENAME = "BaNaNaS-index.json"
+# Increase this whenever the layout of the index changes.
+BANANAS_INDEX_FORMAT = 1
+
 BANANAS_CACHE = {
     "ai": {},
     "newgrf": {},
     "game-script": {},
 }
 BANANAS_LOOKUP = {}
+# Content that is referenced by the summary, in the order it was first seen.
+BANANAS_USED = {
+    "ai": {},
+    "newgrf": {},
+    "game-script": {},
+}
+# The loaded index; False if there is no (up-to-date) index.
+BANANAS_INDEX = None
 
 
 def _count(summary, content_data, seconds, name):
     if content_data["version"] == "(unknown)":
         # For "unknown", only record the highest value.
-        summary[name][content_data["version"]] = max(summary[name][content_data["version"]], seconds)
+        summary.maximum_value(name, content_data["version"], seconds)
     else:
-        summary[name][content_data["version"]] += seconds
+        summary.add_value(name, content_data["version"], seconds)
 
 
 def analyse_ais(companies, summary, seconds):
@@ -63,15 +85,19 @@ def analyse_gamescripts(game_script, summary, seconds):
     _count(summary, {"version": game_script_version}, seconds, f"game.game_script.{content_id}")
 
 
-def analyse_grfs(grfs, summary, seconds):
-    if grfs is None:
-        return
+@normalizer(maxsize=4096)
+def resolve_grfs(grfs):
+    # Resolve the activated NewGRFs of a survey, as (grfid, md5sum), into the cells to count and whether only the
+    # highest amount is recorded (see _count), and the content that is referenced. Most players share a handful of
+    # NewGRF configurations, so these are only resolved once.
+    cells = []
+    used = []
 
-    for grf_id, params in grfs.items():
-        if params["status"] != "activated":
-            continue
+    for grf_id, md5sum in grfs:
+        content_data = get_bananas_data("newgrf", grf_id, md5sum)
+        if BANANAS_CACHE["newgrf"][grf_id]:
+            used.append(grf_id)
 
-        content_data = get_bananas_data("newgrf", grf_id, params["md5sum"])
         # We only show popularity of content that are uploaded to BaNaNaS, as those are public content.
         # Anything not on BaNaNaS is either private or not yet released. It would be wrong for a survey
         # to leak information about such content.
@@ -85,85 +111,288 @@ def analyse_grfs(grfs, summary, seconds):
             }
 
         set = content_data.get("classification", {}).get("set", "unknown")
-        _count(summary, content_data, seconds, f"game.grf.{set}.{grf_id}")
+        # A content path has a value per version of the content, which never gets close to the TOPK_THRESHOLD.
+        cell = intern_cell(f"game.grf.{set}.{grf_id}", content_data["version"])
+        cells.append((cell, content_data["version"] == "(unknown)"))
+
+    return tuple(cells), tuple(used)
+
+
+def analyse_grfs(grfs, summary, seconds):
+    # Returns the amount of activated NewGRFs.
+    if not grfs:
+        return 0
+
+    cells, used = resolve_grfs(
+        tuple((grf_id, params["md5sum"]) for grf_id, params in grfs.items() if params["status"] == "activated")
+    )
+
+    for content_id in used:
+        BANANAS_USED["newgrf"][content_id] = True
+
+    for cell, unknown in cells:
+        if unknown:
+            # For "unknown", only record the highest value.
+            summary.maximum(cell, seconds)
+        else:
+            summary.add(cell, seconds)
+
+    return len(cells)
 
 
 def get_bananas_data(content_type, content_id, md5sum):
     if content_id not in BANANAS_CACHE[content_type]:
+        count("bananas.miss")
         load_bananas_data(content_type, content_id)
+    else:
+        count("bananas.hit")
 
     if not BANANAS_CACHE[content_type][content_id]:
         return None
 
-    BANANAS_CACHE[content_type][content_id]["used"] = True
+    BANANAS_USED[content_type][content_id] = True
 
     md5sum_partial = md5sum[:8].lower()
     return BANANAS_CACHE[content_type][content_id]["versions"].get(md5sum_partial)
 
 
-def lookup_bananas_id(content_type, name):
-    def fix_name(name):
-        # Replace some common words.
-        name = name.replace("&", "and")
+def _fix_name(name):
+    # Replace some common words.
+    name = name.replace("&", "and")
 
-        # Remove all non-alpha characters and make it lowercase.
-        name = "".join([c for c in name if c.isalpha()]).lower()
+    # Remove all non-alpha characters and make it lowercase.
+    name = "".join([c for c in name if c.isalpha()]).lower()
 
-        return name
+    return name
 
-    if content_type not in BANANAS_LOOKUP:
-        BANANAS_LOOKUP[content_type] = {}
 
-        for content in glob.glob(f"BaNaNaS/{content_type}/*/global.yaml"):
-            content_id = os.path.basename(os.path.dirname(content))
-            data = load_bananas_data(content_type, content_id)
-            BANANAS_LOOKUP[content_type][fix_name(data["general"]["name"])] = content_id
+def lookup_bananas_id(content_type, name):
+    load_bananas_lookup(content_type)
 
-    content_id = BANANAS_LOOKUP[content_type].get(fix_name(name))
+    content_id = BANANAS_LOOKUP[content_type].get(_fix_name(name))
     if content_id is None:
         return None
 
-    BANANAS_CACHE[content_type][content_id]["used"] = True
+    BANANAS_USED[content_type][content_id] = True
     return content_id
 
 
-def load_bananas_data(content_type, content_id):
-    BANANAS_CACHE[content_type][content_id] = {}
+def load_bananas_lookup(content_type):
+    if content_type in BANANAS_LOOKUP:
+        return
+
+    BANANAS_LOOKUP[content_type] = {}
+
+    index = _get_bananas_index()
+    if index:
+        content_ids = index[content_type].keys()
+    else:
+        content_ids = [
+            os.path.basename(os.path.dirname(content)) for content in glob.glob(f"BaNaNaS/{content_type}/*/global.yaml")
+        ]
+
+    for content_id in content_ids:
+        data = load_bananas_data(content_type, content_id)
+        BANANAS_LOOKUP[content_type][_fix_name(data["general"]["name"])] = content_id
+
 
+def _read_bananas_yaml(content_type, content_id):
     if os.path.exists(f"BaNaNaS/{content_type}/{content_id}/authors.yaml") is False:
         return None
 
+    data = {}
+
     with open(f"BaNaNaS/{content_type}/{content_id}/global.yaml") as f:
-        BANANAS_CACHE[content_type][content_id]["general"] = yaml.load(f.read(), Loader=yaml.CSafeLoader)
+        data["general"] = yaml.load(f.read(), Loader=yaml.CSafeLoader)
 
     with open(f"BaNaNaS/{content_type}/{content_id}/authors.yaml") as f:
-        BANANAS_CACHE[content_type][content_id]["authors"] = yaml.load(f.read(), Loader=yaml.CSafeLoader)
+        data["authors"] = yaml.load(f.read(), Loader=yaml.CSafeLoader)
 
-    BANANAS_CACHE[content_type][content_id]["versions"] = {}
+    data["versions"] = {}
 
     for versions in glob.glob(f"BaNaNaS/{content_type}/{content_id}/versions/*.yaml"):
         with open(versions) as f:
             version = yaml.load(f.read(), Loader=yaml.CSafeLoader)
-            BANANAS_CACHE[content_type][content_id]["versions"][version["md5sum-partial"]] = version
+            data["versions"][version["md5sum-partial"]] = version
+
+    return data
+
+
+def _read_bananas_index(index, content_type, content_id):
+    entry = index[content_type].get(content_id)
+    if entry is None:
+        return None
+
+    versions = {}
+    for md5sum_partial, (version, set) in entry["versions"].items():
+        versions[md5sum_partial] = {"version": version}
+        if set is not None:
+            versions[md5sum_partial]["classification"] = {"set": set}
+
+    return {
+        "general": {"name": entry["name"]},
+        "versions": versions,
+    }
+
+
+def load_bananas_data(content_type, content_id):
+    index = _get_bananas_index()
+    if index:
+        data = _read_bananas_index(index, content_type, content_id)
+    else:
+        data = _read_bananas_yaml(content_type, content_id)
+
+    BANANAS_CACHE[content_type][content_id] = data or {}
+    return data
+
+
+def get_bananas_revision():
+    # The commit the BaNaNaS checkout is at, read directly from git's files.
+    try:
+        with open("BaNaNaS/.git/HEAD") as f:
+            head = f.read().strip()
+    except OSError:
+        return None
 
-    return BANANAS_CACHE[content_type][content_id]
+    if not head.startswith("ref: "):
+        return head
+    ref = head[len("ref: ") :]
 
+    if os.path.exists(f"BaNaNaS/.git/{ref}"):
+        with open(f"BaNaNaS/.git/{ref}") as f:
+            return f.read().strip()
+
+    if os.path.exists("BaNaNaS/.git/packed-refs"):
+        with open("BaNaNaS/.git/packed-refs") as f:
+            for line in f:
+                commit, _, name = line.strip().partition(" ")
+                if name == ref:
+                    return commit
+
+    return None
+
+
+def _get_bananas_index():
+    global BANANAS_INDEX
+
+    if BANANAS_INDEX is None:
+        BANANAS_INDEX = False
+
+        if os.path.exists(BANANAS_INDEX_FILENAME):
+            with open(BANANAS_INDEX_FILENAME) as f:
+                index = json.load(f)
+
+            # Only use the index if it was built from the current checkout; otherwise fall back to the YAML files.
+            revision = get_bananas_revision()
+            if index["format"] == BANANAS_INDEX_FORMAT and revision is not None and index["revision"] == revision:
+                BANANAS_INDEX = index["content"]
+
+    return BANANAS_INDEX
+
+
+def build_bananas_index(filename):
+    revision = get_bananas_revision()
+    if revision is None:
+        raise Exception("BaNaNaS is not a git checkout; the index would never be considered up-to-date")
 
-def export_bananas_data():
+    content = {}
+
+    for content_type in BANANAS_CACHE:
+        content[content_type] = {}
+
+        for global_yaml in glob.glob(f"BaNaNaS/{content_type}/*/global.yaml"):
+            content_id = os.path.basename(os.path.dirname(global_yaml))
+
+            data = _read_bananas_yaml(content_type, content_id)
+            if data is None:
+                continue
+
+            content[content_type][content_id] = {
+                "name": data["general"]["name"],
+                "versions": {
+                    md5sum_partial: [version["version"], version.get("classification", {}).get("set")]
+                    for md5sum_partial, version in data["versions"].items()
+                },
+            }
+
+    index = {
+        "format": BANANAS_INDEX_FORMAT,
+        "revision": revision,
+        "content": content,
+    }
+    write_json(filename, index)
+
+
+def export_bananas_data(usage=None):
+    # Export the content used in this run, or only the content in "usage" (see export_bananas_usage).
     content = {}
 
     for content_type, cache in BANANAS_CACHE.items():
+        used = BANANAS_USED[content_type] if usage is None else usage[content_type]
+        # Sorted, as the order content is first seen in depends on the input; with columnar packs, for example, a pack
+        # reports the content of all its survey results up front. This way every input gives the same summary.
+        content_ids = sorted(used)
+
         if content_type == "game-script":
             content_type = "game_script"
 
         content[content_type] = {}
 
-        for content_id, data in cache.items():
-            if "used" not in data:
-                continue
-
+        for content_id in content_ids:
             content[content_type][content_id] = {
-                "name": data["general"]["name"],
+                "name": cache[content_id]["general"]["name"],
             }
 
     return content
+
+
+def _reset_bananas_usage():
+    for used in BANANAS_USED.values():
+        used.clear()
+
+
+def export_bananas_usage():
+    return {content_type: list(used) for content_type, used in BANANAS_USED.items()}
+
+
+@contextmanager
+def track_bananas_usage():
+    # Track the content used within this block on its own; afterwards the usage from before is restored.
+    previous = export_bananas_usage()
+    _reset_bananas_usage()
+
+    usage = {}
+    try:
+        yield usage
+    finally:
+        usage.update(export_bananas_usage())
+        _reset_bananas_usage()
+        import_bananas_usage(previous)
+
+
+def import_bananas_usage(usage):
+    # Mark content as used that was seen by another process; it has to be loaded here before it can be exported.
+    for content_type, content_ids in usage.items():
+        for content_id in content_ids:
+            if content_type in ("ai", "game-script"):
+                # AIs and GameScripts are found by name, which loads all of them in one go.
+                load_bananas_lookup(content_type)
+            elif content_id not in BANANAS_CACHE[content_type]:
+                load_bananas_data(content_type, content_id)
+
+            BANANAS_USED[content_type][content_id] = True
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m analysis.content", description="Manage the BaNaNaS data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_index = subparsers.add_parser("build-index", help="Compile the BaNaNaS checkout into a single index file.")
+    build_index.add_argument("--output", default=BANANAS_INDEX_FILENAME, help="Filename of the index.")
+    args = parser.parse_args()
+
+    if args.command == "build-index":
+        build_bananas_index(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import os
+import tarfile
+
+from array import array
+
+from .columnar import COLUMNS_SUFFIX, Columns
+from .content import track_bananas_usage
+from .decode import decode
+from .indexed import INDEXED_SUFFIX, IndexedPackWriter
+from .reader import read_archive
+from .store import CELLS, intern_cell
+from .summarize import summarize_data
+
+
+class _SurveyRecorder:
+    # Stands in for both the summary and the counters of a version, to record what a single survey result counts.
+    # "counts" stays empty, so everything goes through add().
+
+    counts = array("q")
+
+    def __init__(self):
+        self.version = None
+        self.seconds = None
+        self.ids = set()
+        self.cells = []
+
+    def __getitem__(self, version):
+        self.version = version
+        return self
+
+    def add(self, cell, amount):
+        self.cells.append((cell, amount))
+
+    def maximum(self, cell, amount):
+        # Which values only record the highest amount follows from the path; see merge.merge_summary.
+        self.cells.append((cell, amount))
+
+    def add_value(self, path, value, amount):
+        if path == "summary":
+            # Every row already has its seconds, and counts as one.
+            if value == "seconds":
+                self.seconds = amount
+            return
+
+        self.add(intern_cell(path, value), amount)
+
+    def maximum_value(self, path, value, amount):
+        self.maximum(intern_cell(path, value), amount)
+
+
+def convert_archive(filename, output):
+    # Convert a survey pack into a columnar pack, with a row per accepted survey result.
+    columns = Columns()
+
+    with track_bananas_usage() as usage:
+        for raw in read_archive(filename):
+            data = decode(raw)
+
+            recorder = _SurveyRecorder()
+            # The version is stored as it is for weekly summaries; it is mapped to other timeframes when summarizing.
+            summarize_data(recorder, "wk", data)
+            if recorder.version is None:
+                continue
+
+            (session_id,) = recorder.ids
+            columns.add_row(
+                recorder.seconds,
+                data["game"]["timers"]["ticks"],
+                data["schema"],
+                recorder.version,
+                session_id,
+                [(*CELLS[cell], amount) for cell, amount in recorder.cells],
+            )
+
+    # The content IDs are resolved while converting; the BaNaNaS data still has to be loaded when summarizing.
+    columns.content = usage
+    columns.save(output)
+
+
+def convert_archive_indexed(filename, output):
+    # Convert a survey pack into an indexed pack, with every member and what is needed to filter on in the index.
+    writer = IndexedPackWriter(output)
+
+    with tarfile.open(filename, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            with archive.extractfile(member) as fp:
+                raw = fp.read()
+
+            version = seconds = ticks = session = None
+            if member.name.endswith("verified.json"):
+                try:
+                    data = decode(raw)
+                    version = data["info"]["openttd"]["version"]["revision"]
+                    seconds = data["game"]["timers"]["seconds"] if data["schema"] == 1 else data["session"]["seconds"]
+                    ticks = data["game"]["timers"]["ticks"]
+                    session = data["id"] if data["schema"] == 1 else data["session"]["id"]
+                except (KeyError, TypeError, ValueError):
+                    # Invalid survey results are left to the analysis to reject.
+                    pass
+
+            writer.add(member.name, raw, version, seconds, ticks, session)
+
+    writer.close()
+
+
+# Per output format: how to convert, and the suffix of the result.
+FORMATS = {
+    "columnar": (convert_archive, COLUMNS_SUFFIX),
+    "indexed": (convert_archive_indexed, INDEXED_SUFFIX),
+}
+
+
+def get_output_filename(filename, suffix, output_dir=None):
+    name = os.path.basename(filename)
+    for extension in (".tar.xz", ".txz", ".tar.gz", ".tgz", ".tar"):
+        if name.endswith(extension):
+            name = name[: -len(extension)]
+            break
+
+    return os.path.join(output_dir or os.path.dirname(filename), f"{name}{suffix}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.convert", description="Convert survey packs into columnar or indexed packs."
+    )
+    parser.add_argument("filenames", nargs="+", help="Survey packs (tar.xz).")
+    parser.add_argument(
+        "--output", metavar="DIR", help="Directory to write the converted packs to (default: next to the pack)."
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        default="columnar",
+        help="Columnar packs hold the result of summarizing; indexed packs the survey results (default: columnar).",
+    )
+    args = parser.parse_args()
+
+    convert, suffix = FORMATS[args.format]
+
+    for filename in args.filenames:
+        output = get_output_filename(filename, suffix, args.output)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+
+        convert(filename, output)
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+
+# Cross-tabulations: the joint distribution of two or three paths, counted in the same pass as everything else.
+# Each cross-tabulation is counted as a path of its own, with a value per combination, like:
+#   "crosstab.info.os.os.version|game.settings.resolution": {"Windows 11 | 1920,1080": ..}
+# This way the thresholds per version and collapsing values below 0.1% into "(other)" apply as for any other path.
+
+# The cross-tabulations to count, as tuples of paths.
+CROSSTABS = []
+# The paths used by any cross-tabulation.
+CROSSTAB_PATHS = frozenset()
+# The values of CROSSTAB_PATHS of the survey result being summarized.
+CROSSTAB_VALUES = {}
+
+CROSSTAB_PREFIX = "crosstab."
+VALUE_SEPARATOR = " | "
+
+
+def parse_crosstab(text):
+    paths = tuple(text.split(","))
+    if len(paths) not in (2, 3) or not all(paths):
+        raise argparse.ArgumentTypeError(f"A cross-tabulation is two or three paths separated by a comma, not {text}")
+    return paths
+
+
+def set_crosstabs(crosstabs):
+    global CROSSTABS, CROSSTAB_PATHS
+
+    CROSSTABS = [tuple(paths) for paths in crosstabs]
+    CROSSTAB_PATHS = frozenset(path for paths in CROSSTABS for path in paths)
+
+
+def get_crosstabs():
+    return CROSSTABS
+
+
+def get_crosstab_path(paths):
+    return CROSSTAB_PREFIX + "|".join(paths)
+
+
+def _format_value(value):
+    # The same as the value would look like in the summary.
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return str(value)
+
+
+def get_crosstab_value(values):
+    return VALUE_SEPARATOR.join(map(_format_value, values))
+
+
+def count_crosstabs(version_summary, seconds):
+    # Count the combination of values of every cross-tabulation of which all paths were in the survey result.
+    # Survey results without one of these paths end up as "(not reported)", like with any other path.
+    for paths in CROSSTABS:
+        values = [CROSSTAB_VALUES.get(path) for path in paths]
+        if None in values:
+            continue
+
+        version_summary.add_value(get_crosstab_path(paths), get_crosstab_value(values), seconds)
+
+    CROSSTAB_VALUES.clear()
@@ -0,0 +1,64 @@
+import json
+import re
+
+# Decoders for survey results, in order of preference; the first one that is installed is used.
+DECODERS = ["orjson", "msgspec", "json"]
+
+# Matches the value of a field, if it is a plain integer or string.
+PEEK_VALUE = re.compile(rb'\s*:\s*(?:(-?\d+)\s*[,}\]]|"([^"\\]*)")')
+
+
+def _load_decoder(name):
+    if name == "orjson":
+        import orjson
+
+        return orjson.loads
+    if name == "msgspec":
+        import msgspec
+
+        return msgspec.json.Decoder().decode
+    if name == "json":
+        return json.loads
+
+    raise Exception(f"Unknown JSON decoder: {name}")
+
+
+def _find_decoder():
+    for name in DECODERS:
+        try:
+            return name, _load_decoder(name)
+        except ImportError:
+            pass
+
+    raise Exception("No JSON decoder available")
+
+
+DECODER_NAME, _decode = _find_decoder()
+# Peeking at a few fields costs about as much as a full decode with the faster decoders.
+# With Python's own decoder it pays off, as a large share of the survey results is rejected.
+PEEK_BEFORE_DECODE = DECODER_NAME == "json"
+
+
+def decode(raw):
+    try:
+        return _decode(raw)
+    except ValueError:
+        # The faster decoders are more strict (for example about very large numbers); let Python have a go too.
+        return json.loads(raw)
+
+
+def peek(raw, field):
+    # Find the value of a field in a survey result, without decoding it.
+    # The value is only returned if the field is found exactly once; otherwise it is unclear which one is meant.
+    needle = f'"{field}"'.encode()
+
+    index = raw.find(needle)
+    if index == -1 or raw.rfind(needle) != index:
+        return None
+
+    match = PEEK_VALUE.match(raw, index + len(needle))
+    if match is None:
+        return None
+
+    number, string = match.groups()
+    return int(number) if number is not None else string.decode()
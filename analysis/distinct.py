@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import math
+import sys
+
+from array import array
+
+# How to count the different savegames per version: "exact" or "approximate".
+DISTINCT_MODE = "exact"
+
+# HyperLogLog uses 2^precision registers of one byte each; 12 gives a standard error of 1.6%.
+# For small counts (like the THRESHOLD_DIFFERENT_SAVEGAMES) it switches to linear counting, which is far more accurate.
+HYPERLOGLOG_PRECISION = 12
+
+
+def _hash(value):
+    # Python's own hash() differs per process, so use something stable; the result has to be mergeable and storable.
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def encode_array(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode()
+
+
+def decode_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class ExactDistinct:
+    # Exact count of different values, based on a 64-bit hash of each value (8 bytes per value).
+    # Values are appended as they come in, and only sorted / deduplicated when the array grew enough.
+
+    def __init__(self, hashes=None):
+        self._hashes = array("Q") if hashes is None else hashes
+        self._compacted = len(self._hashes)
+
+    def _compact(self):
+        self._hashes = array("Q", sorted(set(self._hashes)))
+        self._compacted = len(self._hashes)
+
+    def add(self, value):
+        self._hashes.append(_hash(value))
+        if len(self._hashes) >= 2 * self._compacted + 1024:
+            self._compact()
+
+    def update(self, other):
+        if not isinstance(other, ExactDistinct):
+            raise Exception("Cannot merge an exact count with an approximate count")
+        self._hashes.extend(other._hashes)
+        self._compact()
+
+    def copy(self):
+        copy = ExactDistinct(array("Q", self._hashes))
+        # The hashes after "_compacted" can still contain duplicates.
+        copy._compacted = self._compacted
+        return copy
+
+    def __len__(self):
+        if self._compacted != len(self._hashes):
+            self._compact()
+        return len(self._hashes)
+
+    def to_state(self):
+        self._compact()
+        return {"mode": "exact", "hashes": encode_array(self._hashes)}
+
+
+class HyperLogLog:
+    # Approximate count of different values, in a fixed amount of memory.
+
+    def __init__(self, registers=None):
+        self._registers = bytearray(1 << HYPERLOGLOG_PRECISION) if registers is None else registers
+
+    def add(self, value):
+        value_hash = _hash(value)
+        index = value_hash >> (64 - HYPERLOGLOG_PRECISION)
+        # The position of the first 1-bit in the remaining bits.
+        rank = (64 - HYPERLOGLOG_PRECISION) - (value_hash & ((1 << (64 - HYPERLOGLOG_PRECISION)) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def update(self, other):
+        if not isinstance(other, HyperLogLog):
+            raise Exception("Cannot merge an approximate count with an exact count")
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def copy(self):
+        return HyperLogLog(bytearray(self._registers))
+
+    def __len__(self):
+        m = len(self._registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0**-register for register in self._registers)
+
+        # For small counts, linear counting is more accurate.
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def to_state(self):
+        return {"mode": "approximate", "registers": base64.b64encode(self._registers).decode()}
+
+
+def set_distinct_mode(mode):
+    global DISTINCT_MODE
+
+    if mode not in ("exact", "approximate"):
+        raise Exception(f"Unknown distinct mode: {mode}")
+    DISTINCT_MODE = mode
+
+
+def get_distinct_mode():
+    return DISTINCT_MODE
+
+
+def new_distinct():
+    if DISTINCT_MODE == "approximate":
+        return HyperLogLog()
+    return ExactDistinct()
+
+
+def distinct_from_state(state):
+    if state["mode"] == "approximate":
+        return HyperLogLog(bytearray(base64.b64decode(state["registers"])))
+    return ExactDistinct(decode_array("Q", state["hashes"]))
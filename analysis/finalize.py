@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import accumulate
+from operator import itemgetter
+
+from .stats import record_dropped_version
+
+# Ensure the summary is always based on a good amount of surveys.
+# Otherwise it is very easy for one user to be visible in the results.
+THRESHOLD_DIFFERENT_SAVEGAMES = 150
+THRESHOLD_DIFFERENT_SURVEYS = 300
+# In what percentile to report savegame sizes.
+SAVEGAME_SIZE_PERCENTILE = [50, 90, 95, 99, 99.9]
+
+CONTENT_PREFIXES = (
+    "game.grf.",
+    "game.ai.",
+    "game.game_script.",
+    "info.configuration.graphics_set.",
+    "info.configuration.music_set.",
+    "info.configuration.sound_set.",
+)
+DISPLAY_OPT_PREFIXES = ("game.settings.display_opt.", "game.settings.extra_display_opt.")
+NEVER_COLLAPSE = frozenset(["true", "false", "(not reported)"])
+
+
+def get_percentiles(buckets, percentiles):
+    # The buckets have to be sorted; the running total is calculated once for all percentiles.
+    keys = list(buckets.keys())
+    running_total = list(accumulate(buckets.values()))
+
+    result = {}
+    for percentile in percentiles:
+        index = bisect_left(running_total, running_total[-1] * percentile / 100)
+        result[percentile] = keys[index] if index < len(keys) else None
+    return result
+
+
+def finalize_summary(summary):
+    # Apply the thresholds, collapse small entries and sort the results of a raw summary.
+    # The raw summary is left untouched, so it can still be stored or extended afterwards.
+    summary = {
+        version: defaultdict(
+            lambda: defaultdict(int), {path: defaultdict(int, data) for path, data in version_summary.items()}
+        )
+        for version, version_summary in summary.items()
+    }
+
+    remove_version = []
+
+    # Calculate the "false" condition of each display option, assuming that if you didn't have it on, it was off.
+    for version, version_summary in summary.items():
+        # The total of every content path; kept up-to-date while collapsing, so it is only calculated once.
+        totals = {}
+
+        for path, data in version_summary.items():
+            if path == "summary":
+                data["ids"] = len(data["ids"])
+
+                if data["ids"] < THRESHOLD_DIFFERENT_SAVEGAMES or data["count"] < THRESHOLD_DIFFERENT_SURVEYS:
+                    remove_version.append(version)
+                    record_dropped_version(version, data["ids"], data["count"])
+                    break
+                continue
+
+            if path == "savegame_size":
+                buckets = dict(sorted(data.items()))
+                percentiles = get_percentiles(buckets, SAVEGAME_SIZE_PERCENTILE)
+                data = {}
+                for percentile in SAVEGAME_SIZE_PERCENTILE:
+                    data[f"Percentile ({percentile}%)"] = percentiles[percentile]
+                data["Average size"] = sum(key * value for key, value in buckets.items()) // sum(buckets.values())
+                version_summary[path] = data
+                continue
+
+            if path.startswith(DISPLAY_OPT_PREFIXES):
+                data["false"] = version_summary["summary"]["seconds"] - data["true"]
+
+            total = sum(data.values())
+
+            if path.startswith(CONTENT_PREFIXES):
+                # Content entries follow special rules (see below).
+                totals[path] = total
+                continue
+
+            # Check if it adds up to the total; if not, it is (most likely) an OS specific setting.
+            if total != version_summary["summary"]["seconds"]:
+                data["(not reported)"] = version_summary["summary"]["seconds"] - total
+
+            # Collapse entries below 0.1% to a single (other) entry, and not true/false.
+            if path != "reason":
+                collapse = [key for key, value in data.items() if value / total < 0.001 and key not in NEVER_COLLAPSE]
+                for key in collapse:
+                    data["(other)"] += data[key]
+                    del data[key]
+
+        # Versions that didn't reach the threshold are removed anyway.
+        if version in remove_version:
+            continue
+
+        def collapse_content(path, target):
+            total = totals[path]
+            if total / version_summary["summary"]["seconds"] < 0.001:
+                version_summary[target]["(other)"] += total
+                totals[target] = totals.get(target, 0) + total
+                del version_summary[path]
+                del totals[path]
+
+        # We iterate again, this time to collapse GRF / AI / GS.
+        for path in list(version_summary.keys()):
+            if path.startswith("game.grf."):
+                set = path.split(".")[2]
+                collapse_content(path, f"game.grf.{set}.(other)")
+            elif path.startswith("game.ai.") or path.startswith("game.game_script."):
+                prefix = ".".join(path.split(".")[:2])
+                collapse_content(path, f"{prefix}.(other)")
+            elif (
+                path.startswith("info.configuration.graphics_set.")
+                or path.startswith("info.configuration.music_set.")
+                or path.startswith("info.configuration.sound_set.")
+            ):
+                prefix = ".".join(path.split(".")[:3])
+                collapse_content(path, f"{prefix}.(other)")
+
+        for path, data in version_summary.items():
+            # Sort the data based on the value.
+            version_summary[path] = dict(sorted(data.items(), key=itemgetter(1), reverse=True))
+
+        def sort_results(item):
+            # Sort based on popularity.
+            for key in CONTENT_PREFIXES:
+                if item[0].startswith(key):
+                    return (key, -totals[item[0]])
+
+            # Sort the data based on the path.
+            return (item[0], 0)
+
+        summary[version] = dict(sorted(summary[version].items(), key=sort_results))
+
+    # Remove versions that didn't reach the threshold.
+    for version in remove_version:
+        del summary[version]
+
+    return dict(sorted(summary.items(), key=lambda item: item[0]))
@@ -0,0 +1,173 @@
+import gzip
+import json
+import lzma
+import os
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .state import AtomicFile, write_json
+from .stats import add_time, clock, count
+
+# Suffix of an indexed pack, as created by "python -m analysis.convert --format indexed".
+# The pack itself is a series of independent xz streams ("frames"), which together are still a valid xz file; the
+# index next to it (INDEX_SUFFIX) tells which member is in which frame, with what is needed to filter on.
+INDEXED_SUFFIX = ".indexed.xz"
+INDEX_SUFFIX = ".index.json.gz"
+# Increase this whenever the layout of an indexed pack or its index changes.
+INDEXED_FORMAT = 2
+# Uncompressed size of a frame; the smaller, the more can be skipped, but the worse the compression.
+FRAME_SIZE = 1024 * 1024
+# How many frames are decompressed at the same time, ahead of the analysis.
+# lzma releases the GIL, so these run in parallel with the analysis and each other.
+DECOMPRESS_THREADS = 4
+
+
+class IndexEntry:
+    # A single member of an indexed pack.
+
+    __slots__ = ("name", "frame", "offset", "length", "state", "version", "seconds", "ticks", "session")
+
+    def __init__(self, name, frame, offset, length, state, version, seconds, ticks, session):
+        self.name = name
+        self.frame = frame
+        self.offset = offset
+        self.length = length
+        self.state = state
+        self.version = version
+        self.seconds = seconds
+        self.ticks = ticks
+        self.session = session
+
+
+def get_member_state(name):
+    # Members are named like "2024-03-01/12:00:00.000Z-<id>.verified.json".
+    return name.rsplit(".", 2)[-2] if name.count(".") >= 2 else None
+
+
+def get_index_filename(filename):
+    return f"{filename}{INDEX_SUFFIX}"
+
+
+class IndexedPackWriter:
+    # Write an indexed pack, member by member.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.frames = []
+        self.members = []
+
+        self._file = AtomicFile(filename, "wb")
+        self._fp = self._file.fp
+        self._frame = bytearray()
+
+    def add(self, name, raw, version=None, seconds=None, ticks=None, session=None):
+        self.members.append(
+            [
+                name,
+                len(self.frames),
+                len(self._frame),
+                len(raw),
+                get_member_state(name),
+                version,
+                seconds,
+                ticks,
+                session,
+            ]
+        )
+        self._frame += raw
+
+        if len(self._frame) >= FRAME_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._frame:
+            return
+
+        data = lzma.compress(self._frame)
+        self.frames.append([self._fp.tell(), len(data)])
+        self._fp.write(data)
+        self._frame = bytearray()
+
+    def close(self):
+        self._flush()
+
+        index = {
+            "format": INDEXED_FORMAT,
+            "frames": self.frames,
+            "members": self.members,
+        }
+        # The index is written last; without it, the pack is not recognized.
+        self._file.commit()
+        write_json(get_index_filename(self.filename), index, compress=True)
+
+
+def load_index(filename):
+    with gzip.open(get_index_filename(filename), "rt") as fp:
+        index = json.load(fp)
+
+    if index["format"] != INDEXED_FORMAT:
+        raise Exception(f"Indexed pack {filename} has format {index['format']}, expected {INDEXED_FORMAT}")
+
+    return index["frames"], [IndexEntry(*member) for member in index["members"]]
+
+
+def _decompress_frame(fd, offset, length, size):
+    # Only decompress the first "size" bytes of the frame; nothing after that is needed.
+    data = lzma.LZMADecompressor().decompress(os.pread(fd, length, offset), max_length=size)
+    count("bytes_decompressed", len(data))
+    return data
+
+
+def read_indexed(filename, get_rejection):
+    # Yield the raw content of every verified survey result in an indexed pack that is not rejected based on its
+    # index entry alone; get_rejection(entry) returns the reason of a rejection, or None.
+    # Frames without any such survey result are not decompressed at all, and the rest only up to the last one needed.
+    frames, entries = load_index(filename)
+
+    wanted = [[] for _ in frames]
+    for entry in entries:
+        # If the filename doesn't end with "verified.json", the survey result
+        # wasn't created by an official client. For now, we skip those results.
+        if not entry.name.endswith("verified.json"):
+            count("unverified")
+            continue
+        count("surveys")
+
+        reason = get_rejection(entry)
+        if reason is not None:
+            count(f"rejected.{reason}")
+            continue
+
+        wanted[entry.frame].append(entry)
+
+    frame_ids = iter([frame for frame, frame_entries in enumerate(wanted) if frame_entries])
+
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=DECOMPRESS_THREADS) as executor:
+            pending = deque()
+
+            def schedule():
+                frame = next(frame_ids, None)
+                if frame is not None:
+                    last = wanted[frame][-1]
+                    size = last.offset + last.length
+                    pending.append((frame, executor.submit(_decompress_frame, fd, *frames[frame], size)))
+
+            for _ in range(DECOMPRESS_THREADS):
+                schedule()
+
+            while pending:
+                frame, future = pending.popleft()
+
+                start = clock()
+                data = future.result()
+                add_time("read", start)
+
+                schedule()
+
+                for entry in wanted[frame]:
+                    yield data[entry.offset : entry.offset + entry.length]
+    finally:
+        os.close(fd)
@@ -0,0 +1,28 @@
+CONTENT_PREFIXES = ("game.ai.", "game.game_script.", "game.grf.")
+
+
+def merge_summary(summary, partial):
+    # Merge a partial summary (as created by summarize_partial, or loaded from a state) into a summary.
+    # Partials have to be merged in the same order as the archives were given,
+    # so the result is identical to summarizing all archives one after another.
+    for version, partial_version in partial.items():
+        version_summary = summary[version]
+
+        for path, data in partial_version.items():
+            if path == "summary":
+                version_summary.add_value(path, "count", data["count"])
+                version_summary.add_value(path, "seconds", data["seconds"])
+                if version_summary.ids is not None:
+                    version_summary.ids.update(data["ids"])
+                else:
+                    version_summary.ids = data["ids"].copy()
+                continue
+
+            is_content = path.startswith(CONTENT_PREFIXES)
+
+            for key, value in data.items():
+                # For content, "(unknown)" only records the highest value (see content._count).
+                if is_content and key == "(unknown)":
+                    version_summary.maximum_value(path, key, value)
+                else:
+                    version_summary.add_value(path, key, value)
@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+from .stats import count
+from .windows_name import WINDOWS_BUILD_NUMBER_TO_NAME
+
+# Normalizers turn a raw value of a survey result into what is counted. They are pure functions of the raw value,
+# and the same raw values (GPU drivers, OS builds, ..) are sent by many surveys, so their result is cached.
+NORMALIZERS = {}
+# Per normalizer, the (hits, misses) already counted in the stats.
+_COUNTED = {}
+
+
+def normalizer(maxsize):
+    def register(func):
+        cached = lru_cache(maxsize=maxsize)(func)
+        NORMALIZERS[func.__name__] = cached
+        return cached
+
+    return register
+
+
+def count_normalizer_usage():
+    # Add the cache hits / misses since the last call to the stats.
+    for name, func in NORMALIZERS.items():
+        info = func.cache_info()
+        hits, misses = _COUNTED.get(name, (0, 0))
+
+        count(f"normalize.{name}.hit", info.hits - hits)
+        count(f"normalize.{name}.miss", info.misses - misses)
+        _COUNTED[name] = (info.hits, info.misses)
+
+
+@normalizer(maxsize=1024)
+def display_options(data):
+    return tuple(data.split("|")) if data else ()
+
+
+@normalizer(maxsize=4096)
+def video_info(data):
+    # Returns the graphics driver name and its brand.
+    if "(" not in data or data.startswith("sdl "):
+        return "(no hardware acceleration)", "(no hardware acceleration)"
+
+    driver = data.split("(")[0].strip()
+
+    # SDL reports slightly different from the rest.
+    if driver == "sdl-opengl":
+        data = data.split("(", 2)[2]
+    else:
+        data = data.split("(", 1)[1]
+
+    # Only keep the graphics driver name; remove all versions etc.
+    data = data.replace("(TM)", "@TM@").replace("(R)", "@R@").replace("(C)", "@C@")
+    data = data.split(",")[0].split("(")[0].strip()
+    data = data.replace("@TM@", "(TM)").replace("@R@", "(R)").replace("@C@", "(C)")
+
+    if "nvidia" in data.lower() or "geforce" in data.lower() or "quadro" in data.lower():
+        brand = "NVIDIA"
+    elif "intel" in data.lower():
+        brand = "Intel"
+    elif "amd " in data.lower() or "radeon" in data.lower():
+        brand = "AMD"
+    elif "apple" in data.lower():
+        brand = "Apple"
+    else:
+        brand = "(other)"
+
+    return data, brand
+
+
+@normalizer(maxsize=1024)
+def resolution(data):
+    # Returns the width and height.
+    width, _, height = data.partition(",")
+    if width and height and width.isdigit() and height.isdigit():
+        return int(width), int(height)
+
+    # We failed to split in width/height, so record unknowns.
+    return "(unknown)", "(unknown)"
+
+
+@normalizer(maxsize=1024)
+def os_version(data):
+    if data.startswith("Windows"):
+        major, minor, buildnumber = data.split(" ")[1].split(".")
+        os_version = WINDOWS_BUILD_NUMBER_TO_NAME.get(f"{major}.{minor}", data)
+        if major == "10" and buildnumber.isdigit() and int(buildnumber) >= 22000:
+            os_version = WINDOWS_BUILD_NUMBER_TO_NAME.get(f"{major}.{minor}.22000", os_version)
+    elif data.startswith("MacOS"):
+        major, minor, patch = data.split(" ", 1)[1].split(".")
+        if major.isdigit() and int(major) <= 10:
+            os_version = f"MacOS {major}.{minor}"
+        else:
+            os_version = f"MacOS {major}"
+    elif data.startswith("Linux"):
+        os_version = "Linux"
+    else:
+        os_version = data
+
+    return os_version
+
+
+@normalizer(maxsize=1024)
+def os_release(os, release):
+    # info.os.os combined with info.os.release, as their whole is the OS version.
+    return f"{os} {release}".replace(" ()", "").split("-")[0]
+
+
+@normalizer(maxsize=256)
+def content_set(data):
+    # Returns the name of the base set and its version.
+    content, _, content_version = data.partition(".")
+    return content, content_version
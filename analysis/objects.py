@@ -0,0 +1,147 @@
+import datetime
+import os
+import re
+import sys
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .stats import add_time, clock, count
+
+# A directory of survey results as the worker (see workers/src/index.js) stores them in the bucket, before they are
+# packed (see .github/workflows/pack-results.yml), like "2024-03-01/12:00:00.000Z-<id>.verified.json".
+# Objects are named after the moment they were stored, so new objects sort after the ones already there.
+# The directory can be the whole bucket, or a single day of it; the day is always the name of the parent directory.
+OBJECT_DAY = re.compile(r"\d{4}-\d{2}-\d{2}$")
+OBJECT_TIME = re.compile(r"\d{2}:\d{2}:\d{2}")
+# Objects stored less than this long ago are left for the next run, as an upload that started before them might not
+# have finished yet; reading them now would move the watermark past that upload.
+SETTLE_TIME = datetime.timedelta(minutes=5)
+# How many objects are read at the same time, ahead of the analysis.
+OBJECT_READERS = 16
+
+# Per directory, the range of object names to read, as (after, up to); see set_watermarks.
+WATERMARKS = {}
+
+
+def is_object_directory(filename):
+    return os.path.isdir(filename)
+
+
+def get_object_key(directory):
+    # The same directory can be given in different ways, like with or without a trailing slash, or relative to another
+    # working directory.
+    return os.path.abspath(directory)
+
+
+def set_watermarks(watermarks):
+    global WATERMARKS
+    WATERMARKS = watermarks
+
+
+def get_watermarks():
+    return WATERMARKS
+
+
+def _get_object_time(filename):
+    day = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+    time = OBJECT_TIME.match(os.path.basename(filename))
+    if OBJECT_DAY.match(day) is None or time is None:
+        return None
+    return datetime.datetime.fromisoformat(f"{day}T{time.group(0)}+00:00")
+
+
+def list_objects(directory, after=None, up_to=None):
+    # The names of the objects in the directory, in order, after the "after" name up to and including "up_to".
+    # Without "up_to", recent objects (see SETTLE_TIME) are left out.
+    # Files not named like an object (like a ".DS_Store") are never read; without knowing when they were stored, there
+    # is no telling whether an upload before them is still running.
+    settled = datetime.datetime.now(datetime.timezone.utc) - SETTLE_TIME
+
+    names = []
+    for root, _, files in os.walk(directory):
+        prefix = os.path.relpath(root, directory).replace(os.sep, "/")
+        for file in files:
+            name = file if prefix == "." else f"{prefix}/{file}"
+            if after is not None and name <= after:
+                continue
+
+            stored = _get_object_time(os.path.join(root, file))
+            if stored is None:
+                # Only warn when deciding the range; within a range, the same file would be warned about again.
+                if up_to is None:
+                    print(
+                        f"WARNING: skipping {os.path.join(root, file)}; expected <YYYY-MM-DD>/<HH:MM:SS>..",
+                        file=sys.stderr,
+                    )
+                continue
+
+            if up_to is not None:
+                if name > up_to:
+                    continue
+            else:
+                if stored > settled:
+                    continue
+            names.append(name)
+
+    names.sort()
+    return names
+
+
+def get_new_watermarks(directories, watermarks):
+    # Decide which objects this run reads: everything after the watermark of the previous run, up to what has settled.
+    # The new watermark is the last of these; a directory without new objects keeps its watermark.
+    ranges = {}
+    for directory in directories:
+        key = get_object_key(directory)
+        after = watermarks.get(key)
+        names = list_objects(directory, after)
+        ranges[key] = (after, names[-1] if names else after)
+    return ranges
+
+
+def _read_object(filename):
+    with open(filename, "rb") as fp:
+        return fp.read()
+
+
+def read_objects(directory):
+    # Yield the raw content of every verified survey result in the directory, within its range (see set_watermarks).
+    # Files are read in parallel threads, while the analysis continues with the ones already read.
+    key = get_object_key(directory)
+    if key in WATERMARKS:
+        after, up_to = WATERMARKS[key]
+        # Without an "up_to", there was nothing to read when the range was decided.
+        names = list_objects(directory, after, up_to) if up_to is not None else []
+    else:
+        names = list_objects(directory)
+
+    filenames = deque()
+    for name in names:
+        # If the filename doesn't end with "verified.json", the survey result
+        # wasn't created by an official client. For now, we skip those results.
+        if not name.endswith("verified.json"):
+            count("unverified")
+            continue
+        filenames.append(os.path.join(directory, name))
+
+    with ThreadPoolExecutor(max_workers=OBJECT_READERS) as executor:
+        pending = deque()
+
+        def schedule():
+            if filenames:
+                pending.append(executor.submit(_read_object, filenames.popleft()))
+
+        for _ in range(OBJECT_READERS):
+            schedule()
+
+        while pending:
+            start = clock()
+            raw = pending.popleft().result()
+            add_time("read", start)
+
+            schedule()
+
+            count("surveys")
+            count("bytes_decompressed", len(raw))
+            yield raw
@@ -0,0 +1,70 @@
+from .crosstab import get_crosstabs, parse_crosstab
+from .distinct import get_distinct_mode, set_distinct_mode
+from .objects import get_watermarks, set_watermarks
+from .s3 import get_s3_cache_dir, reset_s3_client, set_s3_cache_dir
+from .sample import get_sample_rate, set_sample_rate
+from .stats import enable_stats, is_stats_enabled
+from .summarize import configure_crosstabs
+
+# The options that change how survey results are summarized, shared by every command that summarizes them; and the
+# settings a worker process has to start with to summarize the same way as the main process.
+
+
+def add_distinct_argument(parser):
+    parser.add_argument(
+        "--distinct",
+        choices=["exact", "approximate"],
+        default="exact",
+        help="How to count the different savegames; approximate uses a fixed amount of memory (default: exact).",
+    )
+
+
+def add_summary_arguments(parser):
+    add_distinct_argument(parser)
+    parser.add_argument(
+        "--crosstab",
+        metavar="PATH,PATH[,PATH]",
+        type=parse_crosstab,
+        action="append",
+        default=[],
+        help="Also count the joint distribution of two or three paths, like info.os.os.version,info.os.vendor",
+    )
+    parser.add_argument(
+        "--sample",
+        metavar="RATE",
+        type=float,
+        default=1.0,
+        help="Only summarize this fraction of the sessions, like 0.01, and add confidence intervals (default: 1).",
+    )
+
+
+def apply_summary_arguments(args):
+    set_distinct_mode(args.distinct)
+    configure_crosstabs(args.crosstab)
+    set_sample_rate(args.sample)
+
+
+def _init_worker(distinct_mode, crosstabs, sample_rate, watermarks, s3_cache_dir, stats):
+    set_distinct_mode(distinct_mode)
+    configure_crosstabs(crosstabs)
+    set_sample_rate(sample_rate)
+    set_watermarks(watermarks)
+    set_s3_cache_dir(s3_cache_dir)
+    reset_s3_client()
+    if stats:
+        enable_stats()
+
+
+def get_worker_options():
+    # Arguments for a ProcessPoolExecutor, so its workers start with the settings of this process.
+    return {
+        "initializer": _init_worker,
+        "initargs": (
+            get_distinct_mode(),
+            get_crosstabs(),
+            get_sample_rate(),
+            get_watermarks(),
+            get_s3_cache_dir(),
+            is_stats_enabled(),
+        ),
+    }
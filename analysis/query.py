@@ -0,0 +1,218 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+import sys
+
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .buckets import get_archive_date
+from .content import BANANAS_USED, export_bananas_data, import_bananas_usage
+from .distinct import set_distinct_mode
+from .finalize import finalize_summary
+from .merge import merge_summary
+from .options import add_distinct_argument
+from .state import decode_summary, encode_summary, write_json
+from .store import export_summary, new_summary, reset_cells
+from .summarize import summarize_partial_timeframes
+
+# A directory with the raw summary (before any thresholds are applied) of every day, per timeframe, like
+# "<dir>/wk/2024-03-01.json.gz". Any range of days can be summarized from these, without reading a single pack.
+TIMEFRAMES = ["wk", "q"]
+# Increase this whenever the layout of a day changes.
+DAY_FORMAT = 1
+# How many days are kept in memory, decoded; a quarter is about 92 days.
+DAY_CACHE_SIZE = 128
+# How many responses are kept in memory; asking for the same range again is answered from here.
+QUERY_CACHE_SIZE = 32
+
+
+def get_day_filename(directory, timeframe, date):
+    return os.path.join(directory, timeframe, f"{date}.json.gz")
+
+
+def add_day(directory, filename):
+    # Summarize a daily survey pack (for every timeframe at once) and store the raw result as its day.
+    date = get_archive_date(filename)
+    partials, usage = summarize_partial_timeframes(TIMEFRAMES, filename)
+
+    for timeframe, partial in partials.items():
+        day = {
+            "format": DAY_FORMAT,
+            "archive": os.path.basename(filename),
+            "summary": encode_summary(partial),
+            "content": usage,
+        }
+        day_filename = get_day_filename(directory, timeframe, date)
+        os.makedirs(os.path.dirname(day_filename), exist_ok=True)
+        write_json(day_filename, day, compress=True)
+
+    return date
+
+
+@lru_cache(maxsize=DAY_CACHE_SIZE)
+def _load_day(filename, mtime):
+    # The modification time is part of the cache key, so a day that is added again is loaded again.
+    with gzip.open(filename, "rt") as fp:
+        day = json.load(fp)
+
+    if day["format"] != DAY_FORMAT:
+        raise Exception(f"Day {filename} has format {day['format']}, expected {DAY_FORMAT}")
+
+    return decode_summary(day["summary"]), day["content"]
+
+
+def _get_days(directory, timeframe, start, end):
+    # The days within the range that have a summary, with their modification time.
+    days = []
+    for offset in range((end - start).days + 1):
+        filename = get_day_filename(directory, timeframe, start + datetime.timedelta(days=offset))
+        try:
+            days.append((filename, os.stat(filename).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+    return tuple(days)
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _query(days):
+    # Every response starts from a fresh store, so it doesn't depend on what was asked before.
+    reset_cells()
+    summary = new_summary()
+    usage = {content_type: {} for content_type in BANANAS_USED}
+
+    # Days are merged in order, so the result is identical to summarizing their packs one after another.
+    for filename, mtime in days:
+        partial, day_usage = _load_day(filename, mtime)
+        merge_summary(summary, partial)
+
+        import_bananas_usage(day_usage)
+        for content_type, content_ids in day_usage.items():
+            usage[content_type].update(dict.fromkeys(content_ids))
+
+    summary = {
+        "survey": finalize_summary(export_summary(summary)),
+        "content": export_bananas_data({content_type: list(used) for content_type, used in usage.items()}),
+    }
+    return json.dumps(summary, indent=2)
+
+
+def get_query_error(timeframe, start, end):
+    # What is wrong with the query, if anything.
+    if timeframe not in TIMEFRAMES:
+        return f"Unknown timeframe: {timeframe}"
+    if end < start:
+        return f"Range ends ({end}) before it starts ({start})"
+    return None
+
+
+def query(directory, timeframe, start, end):
+    # The summary of the days from start to end (inclusive), in the same layout as "python -m analysis" creates,
+    # together with the amount of days that had a summary.
+    error = get_query_error(timeframe, start, end)
+    if error is not None:
+        raise Exception(error)
+
+    days = _get_days(directory, timeframe, start, end)
+    return _query(days), len(days)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # GET /summary?timeframe=wk&from=2024-03-01&to=2024-03-31
+
+    directory = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/summary":
+            self._respond(404, "Not found\n")
+            return
+
+        arguments = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        timeframe = arguments.get("timeframe", "wk")
+        try:
+            start = datetime.date.fromisoformat(arguments["from"])
+            end = datetime.date.fromisoformat(arguments["to"])
+        except KeyError as e:
+            self._respond(400, f"Missing parameter: {e.args[0]}\n")
+            return
+        except ValueError as e:
+            self._respond(400, f"{e}\n")
+            return
+
+        error = get_query_error(timeframe, start, end)
+        if error is not None:
+            self._respond(400, f"{error}\n")
+            return
+
+        try:
+            body, days = query(self.directory, timeframe, start, end)
+        except Exception as e:
+            # Anything going wrong from here on is not the fault of the request, like a broken day.
+            self.log_error("Failed to summarize %s: %r", self.path, e)
+            self._respond(500, "Internal error\n")
+            return
+
+        self._respond(200, body, "application/json", {"X-Survey-Days": str(days)})
+
+    def _respond(self, status, body, content_type="text/plain", headers=None):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(directory, host, port):
+    # A single thread is on purpose: summaries are merged into global state (see analysis.store and analysis.content).
+    QueryHandler.directory = directory
+    with HTTPServer((host, port), QueryHandler) as server:
+        print(f"Serving summaries of {directory} on http://{host}:{port}/summary", file=sys.stderr)
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.query", description="Summarize any range of days from the raw summary of every day."
+    )
+    add_distinct_argument(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="Summarize daily survey packs into the directory, one day per pack.")
+    add.add_argument("directory", help="Directory with the summary of every day.")
+    add.add_argument("filenames", nargs="+", help="Daily survey packs (tar.xz) or columnar / indexed packs.")
+
+    get = subparsers.add_parser("get", help="Print the summary of a range of days.")
+    get.add_argument("directory", help="Directory with the summary of every day.")
+    get.add_argument("timeframe", choices=TIMEFRAMES, help="Timeframe of the summary (week or quarter).")
+    get.add_argument("--from", dest="start", required=True, type=datetime.date.fromisoformat, help="First day.")
+    get.add_argument("--to", dest="end", required=True, type=datetime.date.fromisoformat, help="Last day.")
+
+    server = subparsers.add_parser("serve", help="Answer GET /summary?timeframe=&from=&to= over HTTP.")
+    server.add_argument("directory", help="Directory with the summary of every day.")
+    server.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    server.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000).")
+    args = parser.parse_args()
+
+    set_distinct_mode(args.distinct)
+
+    if args.command == "add":
+        for filename in args.filenames:
+            print(add_day(args.directory, filename), file=sys.stderr)
+    elif args.command == "get":
+        body, days = query(args.directory, args.timeframe, args.start, args.end)
+        if days == 0:
+            print(f"WARNING: no days from {args.start} to {args.end} in {args.directory}", file=sys.stderr)
+        print(body)
+    elif args.command == "serve":
+        serve(args.directory, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import queue
+import shutil
+import subprocess
+import tarfile
+import threading
+
+from contextlib import contextmanager
+
+from .s3 import is_s3_url, open_s3
+from .stats import add_time, clock, count
+
+# How many survey results can be read ahead of the analysis.
+# This keeps memory usage flat, no matter how big an archive is.
+READ_AHEAD = 256
+# External decompressors, in order of preference. These run in their own process, next to the analysis.
+DECOMPRESSORS = [
+    ["pixz", "-d"],
+    ["xz", "-d", "-c", "-T0"],
+]
+
+_DONE = object()
+
+
+@contextmanager
+def _open_input(filename):
+    if is_s3_url(filename):
+        with open_s3(filename) as fp:
+            yield fp
+        return
+
+    with open(filename, "rb") as fp:
+        yield fp
+
+
+def _feed(source, destination):
+    # Copy a stream into the stdin of a decompressor; stops early if the decompressor went away.
+    try:
+        shutil.copyfileobj(source, destination, 1024 * 1024)
+    except (BrokenPipeError, ValueError):
+        pass
+    finally:
+        try:
+            destination.close()
+        except BrokenPipeError:
+            pass
+
+
+@contextmanager
+def _open_archive(filename, stop):
+    decompressor = None
+    if filename.endswith((".tar.xz", ".txz")):
+        decompressor = next((command for command in DECOMPRESSORS if shutil.which(command[0])), None)
+
+    if decompressor is None:
+        if not is_s3_url(filename):
+            with tarfile.open(filename) as archive:
+                yield archive
+            return
+
+        with _open_input(filename) as fp:
+            with tarfile.open(fileobj=fp, mode="r|*") as archive:
+                yield archive
+            if not stop.is_set():
+                # Read up to the end, so a copy of it can be kept (see analysis.s3).
+                while fp.read(1024 * 1024):
+                    pass
+        return
+
+    with _open_input(filename) as fp:
+        if not is_s3_url(filename):
+            # A local file is handed to the decompressor as it is.
+            process = subprocess.Popen(decompressor, stdin=fp, stdout=subprocess.PIPE)
+            feeder = None
+        else:
+            # Anything else is fed to the decompressor while it is being downloaded.
+            process = subprocess.Popen(decompressor, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            feeder = threading.Thread(target=_feed, args=(fp, process.stdin), daemon=True)
+            feeder.start()
+
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+                yield archive
+        finally:
+            if stop.is_set():
+                process.kill()
+            else:
+                # tarfile stops reading at the end-of-archive marker; consume the padding after it too.
+                while process.stdout.read(1024 * 1024):
+                    pass
+            process.stdout.close()
+            if feeder is not None:
+                feeder.join()
+            if process.wait() != 0 and not stop.is_set():
+                raise Exception(f"Failed to decompress {filename} with {decompressor[0]}")
+
+
+def _read_archive(filename, results, stop):
+    def put(item):
+        # Wait for room in the queue, unless the analysis is no longer interested.
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    try:
+        with _open_archive(filename, stop) as archive:
+            start = clock()
+            for member in archive:
+                if stop.is_set():
+                    break
+
+                if not member.isfile():
+                    continue
+                count("bytes_decompressed", member.size)
+
+                # If the filename doesn't end with "verified.json", the survey result
+                # wasn't created by an official client. For now, we skip those results.
+                if not member.name.endswith("verified.json"):
+                    count("unverified")
+                    continue
+
+                with archive.extractfile(member) as fp:
+                    raw = fp.read()
+                count("surveys")
+                add_time("read", start)
+
+                put(raw)
+                start = clock()
+    except Exception as e:
+        put(e)
+
+    put(_DONE)
+
+
+def read_archive(filename):
+    # Yield the raw content of every verified survey result in the archive.
+    # Decompression happens in another thread (or process), so it overlaps with the analysis.
+    results = queue.Queue(maxsize=READ_AHEAD)
+    stop = threading.Event()
+
+    thread = threading.Thread(target=_read_archive, args=(filename, results, stop), daemon=True)
+    thread.start()
+
+    try:
+        while (item := results.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
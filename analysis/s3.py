@@ -0,0 +1,211 @@
+import datetime
+import io
+import os
+import sys
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .state import AtomicFile
+from .stats import count
+
+# Size of a single ranged GET.
+S3_CHUNK_SIZE = 8 * 1024 * 1024
+# How many ranged GETs of an archive run at the same time, ahead of what is decompressed.
+# This also bounds the memory used per archive to S3_CONCURRENCY * S3_CHUNK_SIZE.
+S3_CONCURRENCY = 4
+# Directory to keep a copy of every downloaded archive in; None to not keep them.
+S3_CACHE_DIR = None
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+# Per URL, the size and ETag as asked for the first time this run; see get_s3_object.
+_OBJECTS = {}
+
+
+def set_s3_cache_dir(cache_dir):
+    global S3_CACHE_DIR
+    S3_CACHE_DIR = cache_dir
+
+
+def get_s3_cache_dir():
+    return S3_CACHE_DIR
+
+
+def reset_s3_client():
+    # A boto3 client isn't safe to use after a fork; workers create their own.
+    # The lock is replaced too, as it might have been held by another thread of the parent during the fork.
+    global _CLIENT, _CLIENT_LOCK
+    _CLIENT = None
+    _CLIENT_LOCK = threading.Lock()
+
+
+_CLIENT_LOCK = threading.Lock()
+# Per URL, the size and ETag as asked for the first time this run; see get_s3_object.
+_OBJECTS = {}
+
+
+def is_s3_url(filename):
+    return filename.startswith("s3://")
+
+
+def parse_s3_url(url):
+    bucket, _, key = url[len("s3://") :].partition("/")
+    return bucket, key
+
+
+def _get_client():
+    global _CLIENT
+
+    # Ranged GETs run in threads; creating a boto3 client is not thread-safe, so only one thread creates it.
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            try:
+                import boto3
+            except ImportError:
+                raise Exception("Reading from S3 requires boto3; install it with 'pip install boto3'")
+
+            # Credentials and the endpoint (for example AWS_ENDPOINT_URL for MinIO) come from the environment.
+            _CLIENT = boto3.client("s3")
+
+        return _CLIENT
+
+
+def get_pack_urls(prefix, start_date, end_date):
+    # The URLs of the daily survey packs from start_date to end_date (inclusive), stored as
+    # <prefix>/YYYY/MM/openttd-survey-pack.YYYY-MM-DD.tar.xz. Days without a pack are skipped with a warning.
+    bucket, key_prefix = parse_s3_url(prefix.rstrip("/"))
+    if key_prefix:
+        key_prefix += "/"
+
+    days = [start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+
+    # A single listing per month is cheaper than a request per day.
+    existing = set()
+    paginator = _get_client().get_paginator("list_objects_v2")
+    for month in dict.fromkeys(f"{day:%Y/%m}" for day in days):
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{key_prefix}{month}/"):
+            existing.update(entry["Key"] for entry in page.get("Contents", []))
+
+    urls = []
+    for day in days:
+        key = f"{key_prefix}{day:%Y/%m}/openttd-survey-pack.{day}.tar.xz"
+        if key not in existing:
+            print(f"WARNING: no survey pack for {day} in {prefix}", file=sys.stderr)
+            continue
+        urls.append(f"s3://{bucket}/{key}")
+
+    return urls
+
+
+def get_s3_object(url):
+    # The size and ETag of an object; the ETag changes whenever the content does.
+    # Only asked once per run, so the cache key (see analysis.cache) and the download agree on what was read.
+    if url not in _OBJECTS:
+        bucket, key = parse_s3_url(url)
+        response = _get_client().head_object(Bucket=bucket, Key=key)
+        _OBJECTS[url] = response["ContentLength"], response["ETag"].strip('"')
+    return _OBJECTS[url]
+
+
+def _get_range(bucket, key, start, end):
+    response = _get_client().get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    data = response["Body"].read()
+    count("bytes_downloaded", len(data))
+    return data
+
+
+class S3Reader(io.RawIOBase):
+    # Read an object front to back with ranged GETs, of which S3_CONCURRENCY run ahead of what is read.
+
+    def __init__(self, url, size):
+        self._bucket, self._key = parse_s3_url(url)
+        self._size = size
+        self._offsets = iter(range(0, size, S3_CHUNK_SIZE))
+        self._executor = ThreadPoolExecutor(max_workers=S3_CONCURRENCY)
+        self._pending = deque()
+        self._buffer = memoryview(b"")
+
+        for _ in range(S3_CONCURRENCY):
+            self._schedule()
+
+    def _schedule(self):
+        offset = next(self._offsets, None)
+        if offset is None:
+            return
+
+        end = min(offset + S3_CHUNK_SIZE, self._size) - 1
+        self._pending.append(self._executor.submit(_get_range, self._bucket, self._key, offset, end))
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._buffer:
+            if not self._pending:
+                return 0
+            self._buffer = memoryview(self._pending.popleft().result())
+            self._schedule()
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+
+class _CachingReader(io.RawIOBase):
+    # Keep a copy of everything read; the copy is only kept if the whole object was read.
+
+    def __init__(self, reader, filename):
+        self._reader = reader
+        self._file = AtomicFile(filename, "wb")
+        self._complete = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self._reader.readinto(buffer)
+        if size == 0:
+            self._complete = True
+        self._file.fp.write(buffer[:size])
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._reader.close()
+            if self._complete:
+                self._file.commit()
+            else:
+                self._file.discard()
+        super().close()
+
+
+@contextmanager
+def open_s3(url):
+    # Open a survey pack on S3 as a stream, so it can be decompressed while it is being downloaded.
+    size, etag = get_s3_object(url)
+
+    cache_filename = None
+    if S3_CACHE_DIR:
+        cache_filename = os.path.join(S3_CACHE_DIR, f"{etag}.{os.path.basename(url)}")
+        if os.path.exists(cache_filename):
+            count("archives_downloaded_cached")
+            with open(cache_filename, "rb") as fp:
+                yield fp
+            return
+        os.makedirs(S3_CACHE_DIR, exist_ok=True)
+
+    reader = S3Reader(url, size)
+    if cache_filename:
+        reader = _CachingReader(reader, cache_filename)
+
+    with io.BufferedReader(reader, buffer_size=1024 * 1024) as fp:
+        yield fp
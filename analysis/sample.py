@@ -0,0 +1,119 @@
+import hashlib
+import math
+
+from .merge import CONTENT_PREFIXES
+
+# Fraction of the sessions to summarize; 1 means everything. See "--sample".
+SAMPLE_RATE = 1.0
+# Path that holds, per version, the sum of the squared minutes of the sampled survey results.
+SAMPLE_PATH = "sample"
+# Z-score of the confidence intervals (95%).
+CONFIDENCE_Z = 1.96
+
+
+def set_sample_rate(rate):
+    global SAMPLE_RATE
+
+    if not 0 < rate <= 1:
+        raise Exception(f"Sample rate has to be above 0 and at most 1, not {rate}")
+    SAMPLE_RATE = rate
+
+
+def get_sample_rate():
+    return SAMPLE_RATE
+
+
+def is_sampled(session_id):
+    # Whether a session is part of the sample. This only depends on the session id, so the same sessions are chosen in
+    # every run and every pack. The hash is personalized, as the distinct counters already use the plain hash to pick
+    # their registers; sampling on the same bits would skew them.
+    if SAMPLE_RATE >= 1:
+        return True
+
+    value_hash = hashlib.blake2b(str(session_id).encode(), digest_size=8, person=b"sample").digest()
+    return int.from_bytes(value_hash, "little") < SAMPLE_RATE * (1 << 64)
+
+
+def get_minutes_squared(seconds):
+    # Minutes instead of seconds, as the sum of squared seconds doesn't fit the 64-bit counters.
+    minutes = seconds // 60
+    return minutes * minutes
+
+
+def pop_effective_surveys(summary):
+    # Take the squared minutes out of a (raw, exported) summary of a sample.
+    # Returns the effective amount of survey results per version, needed for the confidence intervals.
+    effective = {}
+
+    for version, version_summary in summary.items():
+        squares = version_summary.pop(SAMPLE_PATH, {}).get("minutes_squared", 0)
+        minutes = version_summary["summary"]["seconds"] / 60
+        # Survey results are weighted by their seconds; this is the amount of unweighted results with the same variance.
+        effective[version] = minutes * minutes / squares if squares else 0
+
+    return effective
+
+
+def scale_survey(survey, rate):
+    # Scale a finalized summary of a sample back up to the whole population.
+    # This is done after finalizing on purpose: the thresholds of finalize_summary have to apply to the survey results
+    # and savegames that were actually seen, not to an estimate of them.
+    for version_summary in survey.values():
+        for path, data in version_summary.items():
+            if path == "summary":
+                for key in ("count", "seconds", "ids"):
+                    data[key] = round(data[key] / rate)
+                continue
+
+            # Sizes of savegames are percentiles and an average, not amounts.
+            if path == "savegame_size":
+                continue
+
+            is_content = path.startswith(CONTENT_PREFIXES)
+            for key, value in data.items():
+                # For content, "(unknown)" only records the highest value (see content._count); that doesn't scale.
+                if is_content and key == "(unknown)":
+                    continue
+                data[key] = round(value / rate)
+
+
+def export_sample(survey, effective):
+    # The "sample" part of the summary of a sample; the finalized survey results are scaled up in the same go.
+    sample = {
+        "rate": SAMPLE_RATE,
+        "effective_surveys": {version: round(effective[version], 1) for version in survey},
+        "intervals": get_intervals(survey, effective),
+    }
+    scale_survey(survey, SAMPLE_RATE)
+    return sample
+
+
+def _get_interval(share, effective):
+    # Wilson score interval of a share, in percentages.
+    if effective <= 0:
+        return [0.0, 100.0]
+
+    z2 = CONFIDENCE_Z * CONFIDENCE_Z
+    denominator = 1 + z2 / effective
+    center = (share + z2 / (2 * effective)) / denominator
+    margin = CONFIDENCE_Z * math.sqrt(share * (1 - share) / effective + z2 / (4 * effective * effective)) / denominator
+    return [round(max(0.0, center - margin) * 100, 2), round(min(1.0, center + margin) * 100, 2)]
+
+
+def get_intervals(survey, effective):
+    # The confidence interval of the percentage of every value (of the seconds played), per version and path.
+    intervals = {}
+
+    for version, version_summary in survey.items():
+        seconds = version_summary["summary"]["seconds"]
+        intervals[version] = {}
+
+        for path, data in version_summary.items():
+            if path in ("summary", "savegame_size"):
+                continue
+
+            intervals[version][path] = {
+                key: _get_interval(min(value / seconds, 1.0), effective[version]) for key, value in data.items()
+            }
+
+    return intervals
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+
+from .state import write_json
+
+# Increase this whenever the layout of the shards changes.
+SHARDS_FORMAT = 1
+# Per content type (in the "content" of a summary), the paths that reference it.
+CONTENT_TYPE_PREFIXES = {
+    "newgrf": "game.grf.",
+    "ai": "game.ai.",
+    "game_script": "game.game_script.",
+}
+
+
+def get_content_ids(version_summary):
+    # The content referenced by a (finalized) version, per content type.
+    content_ids = {content_type: {} for content_type in CONTENT_TYPE_PREFIXES}
+
+    for path in version_summary:
+        for content_type, prefix in CONTENT_TYPE_PREFIXES.items():
+            if path.startswith(prefix):
+                # NewGRFs are listed per set, like "game.grf.station.4d656f02".
+                content_id = path.split(".")[-1]
+                if content_id != "(other)":
+                    content_ids[content_type][content_id] = True
+                break
+
+    return {content_type: list(ids) for content_type, ids in content_ids.items()}
+
+
+def write_shards(directory, summary):
+    # Write a (finalized) summary as a compact file per version, with only the content that version references,
+    # and an index with per version the totals and the content referenced.
+    os.makedirs(directory, exist_ok=True)
+
+    index = {
+        "format": SHARDS_FORMAT,
+        "versions": {},
+        "content": {content_type: {} for content_type in CONTENT_TYPE_PREFIXES},
+    }
+
+    for version, version_summary in summary["survey"].items():
+        if not version_summary:
+            continue
+
+        content_ids = get_content_ids(version_summary)
+        content = {
+            content_type: {
+                content_id: summary["content"][content_type][content_id]
+                for content_id in ids
+                if content_id in summary["content"].get(content_type, {})
+            }
+            for content_type, ids in content_ids.items()
+        }
+        shard = {"survey": version_summary, "content": content}
+        if "sample" in summary:
+            # Summaries of a sample (see analysis.sample) carry the confidence intervals of every version.
+            shard["sample"] = {
+                "rate": summary["sample"]["rate"],
+                "effective_surveys": summary["sample"]["effective_surveys"][version],
+                "intervals": summary["sample"]["intervals"][version],
+            }
+        write_json(os.path.join(directory, f"{version}.json"), shard)
+
+        index["versions"][version] = {
+            "count": version_summary["summary"]["count"],
+            "seconds": version_summary["summary"]["seconds"],
+            "ids": version_summary["summary"]["ids"],
+            "content": content_ids,
+        }
+        for content_type, ids in content_ids.items():
+            index["content"][content_type].update(dict.fromkeys(ids, True))
+
+    index["content"] = {content_type: list(ids) for content_type, ids in index["content"].items()}
+    if "sample" in summary:
+        index["sample"] = {"rate": summary["sample"]["rate"]}
+    write_json(os.path.join(directory, "index.json"), index)
+
+
+def load_index(directory):
+    with open(os.path.join(directory, "index.json")) as fp:
+        index = json.load(fp)
+
+    if index["format"] != SHARDS_FORMAT:
+        raise Exception(f"Shards in {directory} have format {index['format']}, expected {SHARDS_FORMAT}")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.shards", description="Split existing summaries into a shard per version."
+    )
+    parser.add_argument("filenames", nargs="+", help="Summaries, like _data/summaries/2024/wk10.json.")
+    parser.add_argument(
+        "--output", metavar="DIR", default="_shards", help="Where to write the shards to, as <year>/<name>/."
+    )
+    args = parser.parse_args()
+
+    for filename in args.filenames:
+        with open(filename) as fp:
+            summary = json.load(fp)
+
+        year = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+        name = os.path.splitext(os.path.basename(filename))[0]
+        directory = os.path.join(args.output, year, name)
+
+        write_shards(directory, summary)
+        print(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+
+from .distinct import distinct_from_state
+
+# Increase this whenever the layout of the state file changes.
+STATE_FORMAT = 2
+
+
+class AtomicFile:
+    # A file that only shows up under its name once it is completely written. Until then it is written next to it, as
+    # "<filename>.tmp"; this way an interrupted run, a running server or the site never sees a half-written file.
+    # As a context manager, the file is kept if the block finishes, and discarded if it raises.
+
+    def __init__(self, filename, mode="wt", compress=False):
+        self.filename = filename
+        self.fp = (gzip.open if compress else open)(f"{filename}.tmp", mode)
+
+    def commit(self):
+        self.fp.close()
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+    def discard(self):
+        self.fp.close()
+        os.unlink(f"{self.filename}.tmp")
+
+    def __enter__(self):
+        return self.fp
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def write_json(filename, data, compress=False):
+    with AtomicFile(filename, compress=compress) as fp:
+        json.dump(data, fp, separators=(",", ":"))
+
+
+def _encode_key(key):
+    # Values can be str, int, float, bool or None; encoding them as JSON keeps the type intact.
+    return json.dumps(key)
+
+
+def encode_summary(summary):
+    # Convert a (partial) summary into something that can be stored as JSON.
+    state = {}
+
+    for version, version_summary in summary.items():
+        state[version] = {}
+
+        for path, data in version_summary.items():
+            if path == "summary":
+                state[version][path] = {
+                    "count": data["count"],
+                    "seconds": data["seconds"],
+                    "ids": data["ids"].to_state(),
+                }
+                continue
+
+            state[version][path] = {_encode_key(key): value for key, value in data.items()}
+
+    return state
+
+
+def decode_summary(state):
+    summary = {}
+
+    for version, version_state in state.items():
+        summary[version] = {}
+
+        for path, data in version_state.items():
+            if path == "summary":
+                summary[version][path] = {
+                    "count": data["count"],
+                    "seconds": data["seconds"],
+                    "ids": distinct_from_state(data["ids"]),
+                }
+                continue
+
+            summary[version][path] = {json.loads(key): value for key, value in data.items()}
+
+    return summary
+
+
+def load_state(filename):
+    with gzip.open(filename, "rt") as fp:
+        state = json.load(fp)
+
+    if state["format"] != STATE_FORMAT:
+        raise Exception(f"State file {filename} has format {state['format']}, expected {STATE_FORMAT}")
+
+    state["summary"] = decode_summary(state["summary"])
+    # States from before directories of objects could be read don't have watermarks yet.
+    state.setdefault("watermarks", {})
+    return state
+
+
+def save_state(filename, timeframe, archives, summary, usage, watermarks=None):
+    # The state is the raw summary (before any thresholds are applied), together with the archives it was built from.
+    # For directories of objects (see analysis.objects), it is the name of the last object read instead.
+    state = {
+        "format": STATE_FORMAT,
+        "timeframe": timeframe,
+        "archives": archives,
+        "watermarks": watermarks or {},
+        "summary": encode_summary(summary),
+        "content": usage,
+    }
+    write_json(filename, state, compress=True)
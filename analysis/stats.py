@@ -0,0 +1,138 @@
+import sys
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Metrics about the current run; None if they are not collected, which makes collecting them (nearly) free.
+STATS = None
+
+
+def _new_stats():
+    return {
+        "counters": defaultdict(int),
+        "timings": defaultdict(float),
+        "dropped_versions": {},
+    }
+
+
+def enable_stats():
+    global STATS
+    STATS = _new_stats()
+
+
+def is_stats_enabled():
+    return STATS is not None
+
+
+def count(name, amount=1):
+    if STATS is not None:
+        STATS["counters"][name] += amount
+
+
+def clock():
+    # Start of a timing; pass the result to add_time() when done.
+    return time.perf_counter() if STATS is not None else 0
+
+
+def add_time(name, start):
+    if STATS is not None:
+        STATS["timings"][name] += time.perf_counter() - start
+
+
+def record_dropped_version(version, ids, count):
+    if STATS is not None:
+        STATS["dropped_versions"][version] = {"ids": ids, "count": count}
+
+
+def export_stats():
+    if STATS is None:
+        return {}
+
+    return {
+        "counters": dict(STATS["counters"]),
+        "timings": dict(STATS["timings"]),
+        "dropped_versions": dict(STATS["dropped_versions"]),
+    }
+
+
+def merge_stats(stats):
+    # Merge the stats of another process (see track_stats) into the stats of this one.
+    if STATS is None or not stats:
+        return
+
+    for name, value in stats["counters"].items():
+        STATS["counters"][name] += value
+    for name, value in stats["timings"].items():
+        STATS["timings"][name] += value
+    STATS["dropped_versions"].update(stats["dropped_versions"])
+
+
+@contextmanager
+def track_stats():
+    # Collect the stats within this block on their own, so they can be handed to another process.
+    global STATS
+
+    if STATS is None:
+        yield {}
+        return
+
+    previous = STATS
+    STATS = _new_stats()
+
+    stats = {}
+    try:
+        yield stats
+    finally:
+        stats.update(export_stats())
+        STATS = previous
+
+
+def get_cardinality(summary):
+    # The amount of different values per path (over all versions), highest first.
+    values = defaultdict(set)
+    for version_summary in summary.values():
+        for path, data in version_summary.items():
+            if path != "summary":
+                values[path].update(data.keys())
+
+    return dict(sorted(((path, len(data)) for path, data in values.items()), key=lambda item: item[1], reverse=True))
+
+
+def print_stats(stats, fp=sys.stderr):
+    counters = stats["counters"]
+
+    print(f"Archives: {counters.get('archives', 0)} (of which cached: {counters.get('archives_cached', 0)})", file=fp)
+    if "bytes_downloaded" in counters:
+        print(f"Bytes downloaded: {counters['bytes_downloaded']}", file=fp)
+    print(f"Bytes decompressed: {counters.get('bytes_decompressed', 0)}", file=fp)
+    print(f"Survey results: {counters.get('surveys', 0)} verified, {counters.get('unverified', 0)} unverified", file=fp)
+    print(f"Accepted: {counters.get('accepted', 0)}", file=fp)
+    for name, value in counters.items():
+        if name.startswith("rejected."):
+            print(f"Rejected ({name[len('rejected.'):]}): {value}", file=fp)
+    print(f"Throughput: {stats['surveys_per_second']:.0f} surveys/s over {stats['seconds']:.2f}s", file=fp)
+
+    for name, value in stats["timings"].items():
+        print(f"Time in {name}: {value:.2f}s", file=fp)
+
+    for name in ("hit", "miss"):
+        print(f"BaNaNaS cache {name}: {counters.get(f'bananas.{name}', 0)}", file=fp)
+
+    for name, value in counters.items():
+        if name.startswith("normalize.") and name.endswith(".hit"):
+            misses = counters.get(f"{name[:-len('.hit')]}.miss", 0)
+            rate = value / (value + misses) * 100 if value + misses else 0
+            print(
+                f"Normalizer cache {name[len('normalize.'):-len('.hit')]}: {value} hits, {misses} misses ({rate:.1f}%)",
+                file=fp,
+            )
+
+    print(f"Values replaced in top-k counters: {counters.get('topk.evicted', 0)}", file=fp)
+
+    for version, data in stats["dropped_versions"].items():
+        print(f"Dropped version {version}: {data['ids']} different savegames, {data['count']} surveys", file=fp)
+
+    print("Paths with the most different values:", file=fp)
+    for path, cardinality in list(stats["cardinality"].items())[:10]:
+        print(f"  {path}: {cardinality}", file=fp)
@@ -0,0 +1,131 @@
+from array import array
+from collections import defaultdict
+
+from .topk import TOPK_EXEMPT, TOPK_THRESHOLD, TopK
+
+# Every (path, value) combination seen gets a small integer id, a "cell", which is shared by all versions.
+# Per path there is a dictionary from value to cell; a dictionary (instead of a tuple key) keeps the
+# exact same semantics as a nested dictionary, like True and 1 being the same value.
+PATH_CELLS = {}
+CELLS = []
+
+
+def get_path_cells(path):
+    cells = PATH_CELLS.get(path)
+    if cells is None:
+        cells = PATH_CELLS[path] = {}
+    return cells
+
+
+def intern_cell(path, value):
+    cells = get_path_cells(path)
+
+    cell = cells.get(value)
+    if cell is None:
+        cell = cells[value] = len(CELLS)
+        CELLS.append((path, value))
+    return cell
+
+
+def reset_cells():
+    # Forget every cell, so what is counted next is numbered (and, see TOPK_THRESHOLD, put in a TopK) as in a fresh
+    # process. Only for processes that merge summaries; anything holding on to a cell, like content.resolve_grfs, would
+    # count the wrong value afterwards. The dictionaries are emptied in place, as nodes of the summarize tree keep them.
+    for cells in PATH_CELLS.values():
+        cells.clear()
+    CELLS.clear()
+
+
+class Counters:
+    # The counters of a single version: an array indexed by cell, and the order in which cells were first used.
+    # The order is needed to export in the same order as counting in nested dictionaries would, as the final
+    # sorting keeps ties in that order.
+    # Values of paths that passed the TOPK_THRESHOLD, and weren't seen before that, are counted in a TopK instead.
+
+    __slots__ = ("counts", "order", "ids", "topk")
+
+    def __init__(self):
+        self.counts = array("q")
+        self.order = array("L")
+        self.ids = None
+        self.topk = None
+
+    def _grow(self):
+        self.counts.frombytes(bytes(self.counts.itemsize * (len(CELLS) - len(self.counts))))
+
+    def add(self, cell, amount):
+        if cell >= len(self.counts):
+            self._grow()
+
+        # All amounts are positive, so a zero means this cell wasn't used yet.
+        if self.counts[cell] == 0:
+            self.order.append(cell)
+        self.counts[cell] += amount
+
+    def maximum(self, cell, amount):
+        if cell >= len(self.counts):
+            self._grow()
+
+        if self.counts[cell] == 0:
+            self.order.append(cell)
+        if amount > self.counts[cell]:
+            self.counts[cell] = amount
+
+    def add_value(self, path, value, amount):
+        cells = get_path_cells(path)
+
+        cell = cells.get(value)
+        if cell is None:
+            if len(cells) >= TOPK_THRESHOLD and path not in TOPK_EXEMPT:
+                self._add_topk(path, value, amount)
+                return
+            cell = intern_cell(path, value)
+        self.add(cell, amount)
+
+    def _add_topk(self, path, value, amount):
+        if self.topk is None:
+            self.topk = {}
+
+        topk = self.topk.get(path)
+        if topk is None:
+            topk = self.topk[path] = TopK()
+        topk.add(value, amount)
+
+    def maximum_value(self, path, value, amount):
+        self.maximum(intern_cell(path, value), amount)
+
+    def export(self):
+        # Convert to the nested dictionary of path -> value -> amount.
+        result = {}
+
+        for cell in self.order:
+            path, value = CELLS[cell]
+
+            data = result.get(path)
+            if data is None:
+                data = result[path] = {}
+            data[value] = self.counts[cell]
+
+        if self.topk is not None:
+            for path, topk in self.topk.items():
+                data = result.get(path)
+                if data is None:
+                    data = result[path] = {}
+                amounts, error = topk.export()
+                data.update(amounts)
+                if error:
+                    # Keep the total of the path exact; finalize_summary collapses into "(other)" too.
+                    data["(other)"] = data.get("(other)", 0) + error
+
+        if self.ids is not None:
+            result["summary"]["ids"] = self.ids
+
+        return result
+
+
+def new_summary():
+    return defaultdict(Counters)
+
+
+def export_summary(summary):
+    return {version: counters.export() for version, counters in summary.items()}
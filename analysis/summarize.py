@@ -0,0 +1,505 @@
+from . import crosstab, normalize
+from .columnar import COLUMNS_SUFFIX, summarize_columns
+from .content import analyse_ais, analyse_gamescripts, analyse_grfs, track_bananas_usage
+from .crosstab import CROSSTAB_VALUES, count_crosstabs
+from .decode import PEEK_BEFORE_DECODE, decode, peek
+from .distinct import new_distinct
+from .indexed import INDEXED_SUFFIX, read_indexed
+from .objects import is_object_directory, read_objects
+from .reader import read_archive
+from .sample import SAMPLE_PATH, get_minutes_squared, get_sample_rate, is_sampled
+from .stats import add_time, clock, count
+from .store import export_summary, get_path_cells, new_summary
+from .timeframe import get_timeframe_version
+
+# Ensure games were actually played, and not just opened/closed.
+# Otherwise it is very easy to bring your settings to the top.
+THRESHOLD_GAME_SECONDS = 60
+THRESHOLD_GAME_TICKS = 100
+
+# These versions report the "seconds" wrong for network client games.
+VERSION_BROKEN_NETWORK_CLIENT = [
+    "14.0-beta1",
+    "14.0-beta2",
+    "14.0-beta3",
+    "jgrpp-0.56.2",
+    "jgrpp-0.57.0",
+    "jgrpp-0.57.1",
+]
+VERSION_BROKEN_NETWORK_CLIENT_MASTER = 20240213
+
+BLACKLIST_PATHS = [
+    "date",  # Not interesting.
+    "game.companies",  # Processed differently.
+    "game.game_script",  # Processed differently.
+    "game.grfs",  # Processed differently.
+    "game.settings.game_creation.generation_seed",  # Too many results.
+    "game.settings.game_creation.generation_unique_id",  # Too many results.
+    "game.settings.large_font",  # Might expose user information, and is already covered by info.font.large.
+    "game.settings.last_newgrf_count",  # Not interesting.
+    "game.settings.medium_font",  # Might expose user information, and is already covered by info.font.medium.
+    "game.settings.mono_font",  # Might expose user information, and is already covered by info.font.mono.
+    "game.settings.music.custom_1",  # Not interesting.
+    "game.settings.music.custom_2",  # Not interesting.
+    "game.settings.music.effect_vol",  # Not interesting.
+    "game.settings.music.music_vol",  # Not interesting.
+    "game.settings.musicset",  # Already in "info.configuration.music_set".
+    "game.settings.player_face",  # Not interesting.
+    "game.settings.small_font",  # Might expose user information, and is already covered by info.font.small.
+    "game.settings.soundsset",  # Already in "info.configuration.sound_set".
+    "game.timers",  # Not interesting.
+    "id",  # Not interesting.
+    "info.compiler",  # Not interesting.
+    "info.configuration.graphics_set_parameters",  # Processed differently.
+    "info.libraries",  # Not interesting.
+    "info.openttd.build_date",  # Not interesting.
+    "info.openttd.version",  # Not interesting.
+    "info.os.machine",  # OS specific setting, not interesting.
+    "info.os.max_ver",  # OS specific setting, Not interesting.
+    "info.os.min_ver",  # OS specific setting, Not interesting.
+    "info.os.release",  # Combined with "info.os.os".
+    "info.os.version",  # OS specific setting, Not interesting.
+    "key",  # Not interesting.
+    "schema",  # Not interesting.
+    "session",  # Processed differently.
+]
+BLACKLIST_PATHS_SET = frozenset(BLACKLIST_PATHS)
+
+
+def _record(version_summary, seconds, node, data):
+    if type(data) is str:
+        if data.startswith('"') and data.endswith('"'):
+            data = data[1:-1]
+        if not data:
+            data = "(empty)"
+
+    if node.crosstab:
+        CROSSTAB_VALUES[node.path] = data
+
+    cell = node.cells.get(data)
+    if cell is None:
+        version_summary.add_value(node.path, data, seconds)
+        return
+    version_summary.add(cell, seconds)
+
+
+def _summarize_ignore(node, version_summary, seconds, data):
+    pass
+
+
+def _summarize_crosstab(node, version_summary, seconds, data):
+    # Takes the value out of the fast path of _summarize_dict, so _record can remember it for the cross-tabulations.
+    _record(version_summary, seconds, node, data)
+
+
+def _summarize_plugin(node, version_summary, seconds, data):
+    # Only track plugins if they are running.
+    for entry in data:
+        if entry["state"] == "running":
+            data = entry["version"]
+            break
+    else:
+        data = "(not running)"
+
+    _summarize(node, version_summary, seconds, data, raw=False)
+
+
+def _summarize_display_opt(node, version_summary, seconds, data):
+    for option in normalize.display_options(data):
+        _summarize(node.child(option), version_summary, seconds, "true")
+
+
+def _summarize_video_info(node, version_summary, seconds, data):
+    data, brand = normalize.video_info(data)
+
+    _summarize(node.child("brand"), version_summary, seconds, brand)
+    _record(version_summary, seconds, node, data)
+
+
+def _summarize_resolution(node, version_summary, seconds, data):
+    width, height = normalize.resolution(data)
+
+    _summarize(node.child("width"), version_summary, seconds, width)
+    _summarize(node.child("height"), version_summary, seconds, height)
+    _record(version_summary, seconds, node, data)
+
+
+def _summarize_os(node, version_summary, seconds, data):
+    _summarize(node.child("version"), version_summary, seconds, normalize.os_version(data))
+    _record(version_summary, seconds, node, data)
+
+
+def _summarize_content_set(node, version_summary, seconds, data):
+    content, content_version = normalize.content_set(data)
+    _record(version_summary, seconds, node.child(content), content_version)
+
+
+def _summarize_os_info(node, version_summary, seconds, data):
+    for key, value in data.items():
+        # Combine info.os.os with info.os.release, as their whole is the OS version.
+        if key == "os":
+            _summarize(node.child("vendor"), version_summary, seconds, value)
+            value = normalize.os_release(value, data["release"])
+
+        _summarize(node.child(key), version_summary, seconds, value)
+
+
+# Paths that need more than just counting their value.
+SUMMARIZE_VALUE = {
+    "game.settings.display_opt": _summarize_display_opt,
+    "game.settings.extra_display_opt": _summarize_display_opt,
+    "game.settings.resolution": _summarize_resolution,
+    "info.configuration.graphics_set": _summarize_content_set,
+    "info.configuration.music_set": _summarize_content_set,
+    "info.configuration.sound_set": _summarize_content_set,
+    "info.configuration.video_info": _summarize_video_info,
+    "info.os.os": _summarize_os,
+}
+SUMMARIZE_DICT = {
+    "info.os": _summarize_os_info,
+}
+
+
+# A single path in a survey result, with everything needed to summarize it.
+# Nodes are created the first time a path is seen; after that, finding how to summarize a setting
+# is a single dictionary lookup, instead of building the path and checking all the special cases again.
+class SettingNode:
+    __slots__ = (
+        "path",
+        "cells",
+        "children",
+        "blacklisted",
+        "crosstab",
+        "summarize_raw",
+        "summarize_value",
+        "summarize_dict",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.cells = get_path_cells(path)
+        self.children = {}
+        self.blacklisted = path in BLACKLIST_PATHS_SET
+        self.crosstab = path in crosstab.CROSSTAB_PATHS
+        self.summarize_value = SUMMARIZE_VALUE.get(path, _summarize_crosstab if self.crosstab else None)
+        self.summarize_dict = SUMMARIZE_DICT.get(path, _summarize_dict)
+
+        if path == "info.plugins":
+            # Broken data from the early days.
+            self.summarize_raw = _summarize_ignore
+        elif path.startswith("info.plugins"):
+            self.summarize_raw = _summarize_plugin
+        else:
+            self.summarize_raw = None
+
+    def child(self, key):
+        node = self.children.get(key)
+        if node is None:
+            node = SettingNode(f"{self.path}.{key}" if self.path else key)
+            self.children[key] = node
+        return node
+
+
+def _summarize(node, version_summary, seconds, data, raw=True):
+    if node.blacklisted:
+        return
+
+    if type(data) is dict:
+        node.summarize_dict(node, version_summary, seconds, data)
+        return
+
+    if raw and node.summarize_raw is not None:
+        node.summarize_raw(node, version_summary, seconds, data)
+        return
+
+    if type(data) is list:
+        # Fonts were of type list in OpenTTD starting with nightly 20251207.
+        # This was reverted in nightly 20251214.
+        # Once support for lists is added, this temporary workaround can be removed.
+        if node.path.startswith("info.font."):
+            return
+        raise Exception("Lists are not implemented yet")
+
+    if node.summarize_value is not None:
+        node.summarize_value(node, version_summary, seconds, data)
+        return
+
+    _record(version_summary, seconds, node, data)
+
+
+def _summarize_dict(node, version_summary, seconds, data):
+    children = node.children
+    counts = version_summary.counts
+
+    for key, value in data.items():
+        child = children.get(key)
+        if child is None:
+            child = node.child(key)
+
+        # Most settings are a plain value; handle those here, as this is called for every setting of every survey.
+        value_type = type(value)
+        if (
+            child.summarize_value is None
+            and child.summarize_raw is None
+            and value_type is not dict
+            and value_type is not list
+        ):
+            if child.blacklisted:
+                continue
+
+            if value_type is str:
+                if value.startswith('"') and value.endswith('"'):
+                    value = value[1:-1]
+                if not value:
+                    value = "(empty)"
+
+            cell = child.cells.get(value)
+            if cell is None:
+                # A new value; this decides whether it gets a cell at all (see Counters.add_value()).
+                version_summary.add_value(child.path, value, seconds)
+                continue
+            # Only a first use of a cell needs the bookkeeping of Counters.add().
+            if cell < len(counts) and counts[cell]:
+                counts[cell] += seconds
+            else:
+                version_summary.add(cell, seconds)
+            continue
+
+        _summarize(child, version_summary, seconds, value)
+
+
+SETTINGS = SettingNode("")
+
+
+def configure_crosstabs(crosstabs):
+    crosstab.set_crosstabs(crosstabs)
+    # Nodes know whether they are part of a cross-tabulation; start over with the new ones.
+    SETTINGS.children.clear()
+
+
+def summarize_settings(summary, version, seconds, data):
+    _summarize_dict(SETTINGS, summary[version], seconds, data)
+
+
+def get_rejection(seconds, ticks, version):
+    # Most survey results are rejected because they are too short or not from a release / nightly.
+    # This allows to check for that without decoding the whole survey result, which is by far the most expensive part.
+    # As the survey result isn't validated yet, anything unexpected means it is left to the full check.
+    # Returns the reason of the rejection, or None if the survey result has to be fully checked.
+    if type(seconds) is int and seconds < THRESHOLD_GAME_SECONDS:
+        return "too-short"
+    if type(ticks) is int and ticks < THRESHOLD_GAME_TICKS:
+        return "too-short"
+    if type(version) is str and "-" in version and version[0:8].isdigit() and version.split("-")[1] != "master":
+        return "branch"
+
+    return None
+
+
+def get_early_rejection(raw):
+    return get_rejection(peek(raw, "seconds"), peek(raw, "ticks"), peek(raw, "revision"))
+
+
+def _get_entry_rejection(entry):
+    # Indexed packs (see analysis.indexed) already know these fields of every survey result.
+    reason = get_rejection(entry.seconds, entry.ticks, entry.version)
+    if reason is None and get_sample_rate() < 1 and entry.session is not None and not is_sampled(entry.session):
+        return "sampled-out"
+    return reason
+
+
+def decode_result(raw):
+    # Decode a survey result; returns None if it is already clear it will be rejected.
+    if PEEK_BEFORE_DECODE:
+        reason = get_early_rejection(raw)
+        if reason is not None:
+            count(f"rejected.{reason}")
+            return None
+
+    if get_sample_rate() < 1:
+        # Most survey results are not part of the sample; if the session is clear, don't even decode them.
+        session_id = peek(raw, "id")
+        if type(session_id) is str and not is_sampled(session_id):
+            count("rejected.sampled-out")
+            return None
+
+    start = clock()
+    data = decode(raw)
+    add_time("decode", start)
+    return data
+
+
+def summarize_result(summary, timeframe, raw):
+    data = decode_result(raw)
+    if data is not None:
+        summarize_data(summary, timeframe, data)
+
+
+def summarize_data(summary, timeframe, data):
+    schema = data["schema"]
+
+    try:
+        if schema == 1:
+            seconds = data["game"]["timers"]["seconds"]
+        else:
+            seconds = data["session"]["seconds"]
+
+        ticks = data["game"]["timers"]["ticks"]
+    except KeyError:
+        # Invalid (or very old) survey result.
+        count("rejected.invalid")
+        return
+
+    # Surveys results that were either mostly paused or really short are skipped
+    # to avoid people gaming the system.
+    if seconds < THRESHOLD_GAME_SECONDS or ticks < THRESHOLD_GAME_TICKS:
+        count("rejected.too-short")
+        return
+
+    sample_rate = get_sample_rate()
+    if sample_rate < 1 and not is_sampled(data["id"] if schema == 1 else data["session"]["id"]):
+        count("rejected.sampled-out")
+        return
+
+    version = data["info"]["openttd"]["version"]["revision"]
+
+    if "-" in version and version[0:8].isdigit():
+        branch = version.split("-")[1]
+        # Only track the nightlies.
+        if branch == "master":
+            date = int(version[0:8])
+            version = "vanilla-master"
+        else:
+            count("rejected.branch")
+            return
+
+    # Due to a bug in older OpenTTD clients, results with network=client report a broken "seconds".
+    if version in VERSION_BROKEN_NETWORK_CLIENT or (
+        version == "vanilla-master" and date < VERSION_BROKEN_NETWORK_CLIENT_MASTER
+    ):
+        if data["info"]["configuration"]["network"] == "client":
+            count("rejected.network-client")
+            return
+        # Due to another bug, the game sometimes doesn't report it was a network=client.
+        # The biggest impact with these games is that they can contain the unixtimestamp
+        # as "seconds". Ignore only this situation here.
+        if seconds > 1000000000:
+            count("rejected.broken-seconds")
+            return
+
+    original_version = version
+    version = get_timeframe_version(timeframe, version)
+
+    count("accepted")
+
+    start = clock()
+    summarize_settings(summary, version, seconds, data)
+    add_time("flatten", start)
+
+    start = clock()
+    analyse_ais(data["game"]["companies"], summary[version], seconds)
+    analyse_gamescripts(data["game"]["game_script"], summary[version], seconds)
+    # Count how many NewGRFs are active.
+    newgrf_count = analyse_grfs(data["game"]["grfs"], summary[version], seconds)
+    add_time("content", start)
+
+    summary[version].add_value("game.newgrf_count", newgrf_count, seconds)
+    # Count how many AIs are active.
+    ai_count = (
+        sum(
+            1
+            for company in data["game"]["companies"].values()
+            if company["type"] == "ai" and company["script"] != "DummyAI"
+        )
+        if data["game"]["companies"]
+        else 0
+    )
+    summary[version].add_value("game.ai_count", ai_count, seconds)
+    # Mention whether a GameScript was used.
+    summary[version].add_value("game.game_script_used", True if data["game"]["game_script"] else False, seconds)
+
+    summary[version].add_value("summary", "count", 1)
+    summary[version].add_value("summary", "seconds", seconds)
+
+    # Quarterly reports are combined per major version; also show the relative usage of versions.
+    if timeframe == "q":
+        summary[version].add_value("info.openttd.version", original_version, seconds)
+
+    if crosstab.CROSSTABS:
+        CROSSTAB_VALUES["game.newgrf_count"] = newgrf_count
+        CROSSTAB_VALUES["game.ai_count"] = ai_count
+        CROSSTAB_VALUES["game.game_script_used"] = True if data["game"]["game_script"] else False
+        CROSSTAB_VALUES["info.openttd.version"] = original_version
+        count_crosstabs(summary[version], seconds)
+
+    # The variance of a sample depends on how the seconds are spread over the survey results (see sample.py).
+    if sample_rate < 1:
+        summary[version].add_value(SAMPLE_PATH, "minutes_squared", get_minutes_squared(seconds))
+
+    # Depending whether the game was saved, we see a savegame-size or not.
+    if schema >= 2 and "savegame_size" in data["session"]:
+        summary[version].add_value("savegame_size", (data["session"]["savegame_size"] // 10000) * 10000, 1)
+
+    if summary[version].ids is None:
+        summary[version].ids = new_distinct()
+    if schema == 1:
+        summary[version].ids.add(data["id"])
+    else:
+        summary[version].ids.add(data["session"]["id"])
+
+
+def summarize_archive(summary, timeframe, filename):
+    summarize_archive_timeframes({timeframe: summary}, filename)
+
+
+def summarize_archive_timeframes(summaries, filename):
+    # Summarize an archive into a summary per timeframe; every survey result is read and decoded only once.
+    if filename.endswith(COLUMNS_SUFFIX):
+        for timeframe, summary in summaries.items():
+            summarize_columns(summary, timeframe, filename)
+        return
+
+    count("archives")
+
+    if filename.endswith(".json"):
+        if not filename.endswith("verified.json"):
+            count("unverified")
+            return
+
+        with open(filename, "rb") as fp:
+            raw = fp.read()
+
+        count("surveys")
+        count("bytes_decompressed", len(raw))
+        results = [raw]
+    elif filename.endswith(INDEXED_SUFFIX):
+        results = read_indexed(filename, _get_entry_rejection)
+    elif is_object_directory(filename):
+        results = read_objects(filename)
+    else:
+        results = read_archive(filename)
+
+    for raw in results:
+        data = decode_result(raw)
+        if data is None:
+            continue
+
+        for timeframe, summary in summaries.items():
+            summarize_data(summary, timeframe, data)
+
+    normalize.count_normalizer_usage()
+
+
+def summarize_partial(timeframe, filename):
+    partials, usage = summarize_partial_timeframes([timeframe], filename)
+    return partials[timeframe], usage
+
+
+def summarize_partial_timeframes(timeframes, filename):
+    # Summarize a single archive into its own summaries, so it can run in a worker process.
+    # The result is exported to plain containers, so it can be pickled back to the main process.
+    summaries = {timeframe: new_summary() for timeframe in timeframes}
+    with track_bananas_usage() as usage:
+        summarize_archive_timeframes(summaries, filename)
+
+    return {timeframe: export_summary(summary) for timeframe, summary in summaries.items()}, usage
@@ -0,0 +1,10 @@
+def get_timeframe_version(timeframe, version):
+    # The version a survey result is summarized under, for the given timeframe.
+    if timeframe == "wk":
+        return version
+    if timeframe == "q":
+        # For quarterly summaries, we only report "14" or "jgrpp" for versions.
+        version = version.rsplit(".")[0]
+        return version.split("-")[0]
+
+    raise Exception(f"Unknown timeframe: {timeframe}")
@@ -0,0 +1,74 @@
+import heapq
+
+from .stats import count
+
+# Once a path has this many different values (over all versions), new values of that path are no longer counted
+# exactly, but in a TopK per version. This keeps the memory of paths with an endless tail of values (resolutions,
+# video drivers, OS versions, ..) fixed, no matter how many different values are sent.
+TOPK_THRESHOLD = 10000
+# How many values a TopK keeps track of. What a value took over from the value it replaced is at most 1/TOPK_CAPACITY
+# of the total amount in the TopK, which is a tenth of the 0.1% below which values are collapsed into "(other)". As only
+# what was certainly counted is exported, a value with up to 0.11% can still be collapsed; anything above never is.
+TOPK_CAPACITY = 10000
+# Paths that are always counted exactly: savegame sizes are buckets to calculate percentiles of, not values that can be
+# collapsed into "(other)". Their amount of buckets is limited by the size of the largest savegame anyway.
+TOPK_EXEMPT = frozenset(["savegame_size"])
+
+
+class TopK:
+    # Space-Saving: count the "capacity" most frequent values, in a fixed amount of memory.
+    # When full, a new value replaces the value with the lowest amount, and takes over that amount as its error. This
+    # means:
+    # - the amounts always add up to the total amount counted, so the total of a path stays exact;
+    # - the amount minus the error is what was certainly counted for a value; the error is at most total / capacity;
+    # - every value with more than total / capacity is guaranteed to be counted.
+    # Only what was certainly counted is exported; the errors go to "(other)", so no value is reported too high.
+
+    __slots__ = ("capacity", "counts", "errors", "heap", "sequence")
+
+    def __init__(self, capacity=TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        # Only values that replaced another value have an error.
+        self.errors = {}
+        # Min-heap of (amount, sequence, value). As amounts only increase, an entry can be lower than the actual
+        # amount; such entries are only corrected when they reach the top. The sequence avoids comparing values.
+        self.heap = []
+        self.sequence = 0
+
+    def add(self, value, amount):
+        counts = self.counts
+
+        if value in counts:
+            counts[value] += amount
+            return
+
+        if len(counts) >= self.capacity:
+            heap = self.heap
+            while True:
+                lowest, _, lowest_value = heap[0]
+                if counts[lowest_value] == lowest:
+                    break
+                heapq.heapreplace(heap, (counts[lowest_value], self.sequence, lowest_value))
+                self.sequence += 1
+
+            heapq.heappop(heap)
+            del counts[lowest_value]
+            self.errors.pop(lowest_value, None)
+            self.errors[value] = lowest
+            amount += lowest
+            count("topk.evicted")
+
+        counts[value] = amount
+        heapq.heappush(self.heap, (amount, self.sequence, value))
+        self.sequence += 1
+
+    def export(self):
+        # The amount certainly counted per value, and the sum of the errors.
+        errors = self.errors
+        amounts = {}
+        for value, amount in self.counts.items():
+            amount -= errors.get(value, 0)
+            if amount:
+                amounts[value] = amount
+        return amounts, sum(errors.values())
@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+
+from urllib.parse import quote
+
+from .shards import load_index
+from .state import write_json
+from .timeframe import get_timeframe_version
+
+# The history of every value of every path, as its share of the seconds played per family of versions:
+#   _trends/index.json               the summaries the trends were built from, to only read new ones next time
+#   _trends/<timeframe>/index.json         the periods, the paths and per family the seconds played per period
+#   _trends/<timeframe>/paths/<path>.json  per family and value, [index of the period, share in percent] for every
+#                                          period the value was reported in
+#   _trends/<timeframe>/latest.json        the most recent period as it is, per family the seconds played per value
+#   _trends/<timeframe>/movers.json        per family, the values of which the share changed most between the two most
+#                                          recent periods
+# A trend chart reads two small files, and a "biggest movers" report only the movers of the timeframe.
+
+# Increase this whenever the layout of the trends changes; this rebuilds them from scratch.
+TRENDS_FORMAT = 3
+# Periods are named like "wk09", "m03" or "q1"; the letters tell the timeframe.
+PERIOD_NAME = re.compile(r"([a-z]+)\d+$")
+# Paths of which a share of the seconds played means nothing.
+SKIP_PATHS = ("summary", "savegame_size")
+# How many of the values that changed most are kept per family, for "movers".
+MOVERS_KEPT = 100
+
+
+def get_family(version):
+    # The same grouping of versions as the quarterly summaries use, like "14" or "jgrpp".
+    return get_timeframe_version("q", version)
+
+
+def get_timeframe(period):
+    match = PERIOD_NAME.search(period)
+    if match is None:
+        raise Exception(f"Cannot find the timeframe of {period}")
+    return match.group(1)
+
+
+def get_path_filename(directory, timeframe, path):
+    # Paths can contain about anything, like the name of a music set; quoting keeps them apart and reversible.
+    return os.path.join(directory, timeframe, "paths", f"{quote(path, safe='')}.json")
+
+
+def _read_json(filename, default=None):
+    if not os.path.exists(filename):
+        return default
+
+    with open(filename) as fp:
+        data = json.load(fp)
+
+    if data["format"] != TRENDS_FORMAT:
+        return default
+    return data
+
+
+def _write_json(filename, data):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    write_json(filename, data)
+
+
+def find_periods(directories):
+    # Every period with a summary, like "2024/wk09", with the file that changes whenever its summary does.
+    # Summaries are either a single file (_data/summaries/<year>/<name>.json) or shards (_shards/<year>/<name>/);
+    # if a period has both, the directory given last wins.
+    periods = {}
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+
+        for year in sorted(os.listdir(directory)):
+            if not os.path.isdir(os.path.join(directory, year)):
+                continue
+
+            for entry in sorted(os.listdir(os.path.join(directory, year))):
+                filename = os.path.join(directory, year, entry)
+                name, extension = os.path.splitext(entry)
+
+                if extension == ".json" and os.path.isfile(filename):
+                    periods[f"{year}/{name}"] = filename
+                elif os.path.isfile(os.path.join(filename, "index.json")):
+                    periods[f"{year}/{entry}"] = os.path.join(filename, "index.json")
+
+    return periods
+
+
+def _hash_file(filename):
+    # The content, not the modification time, as a fresh checkout touches every file.
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        while chunk := fp.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _load_survey(filename):
+    if os.path.basename(filename) != "index.json":
+        with open(filename) as fp:
+            return json.load(fp)["survey"]
+
+    directory = os.path.dirname(filename)
+    survey = {}
+    for version in load_index(directory)["versions"]:
+        with open(os.path.join(directory, f"{version}.json")) as fp:
+            survey[version] = json.load(fp)["survey"]
+    return survey
+
+
+def get_family_seconds(survey):
+    # Per family of versions, the seconds played in total and per value of every path.
+    families = {}
+
+    for version, version_summary in survey.items():
+        if not version_summary:
+            continue
+
+        family = families.setdefault(get_family(version), {"seconds": 0, "values": {}})
+        family["seconds"] += version_summary["summary"]["seconds"]
+
+        for path, data in version_summary.items():
+            if path in SKIP_PATHS:
+                continue
+
+            values = family["values"].setdefault(path, {})
+            for value, amount in data.items():
+                values[value] = values.get(value, 0) + amount
+
+    return families
+
+
+def get_share(amount, seconds):
+    return round(amount / seconds * 100, 3) if seconds else 0
+
+
+def get_shares(families):
+    return {
+        family: {
+            path: {value: get_share(amount, data["seconds"]) for value, amount in values.items()}
+            for path, values in data["values"].items()
+        }
+        for family, data in families.items()
+    }
+
+
+def get_family_movers(latest, previous):
+    # Per family, the values reported in both periods, as [path, value, previous share, latest share], the biggest
+    # change first. Only the first MOVERS_KEPT are kept; nobody reads further down a list of changes than that.
+    families = {}
+
+    for family, paths in sorted(latest.items()):
+        movers = []
+        for path, values in paths.items():
+            previous_values = previous.get(family, {}).get(path, {})
+            for value, share in values.items():
+                if value in previous_values:
+                    movers.append([path, value, previous_values[value], share])
+
+        movers.sort(key=lambda mover: abs(mover[3] - mover[2]), reverse=True)
+        if movers:
+            families[family] = movers[:MOVERS_KEPT]
+
+    return families
+
+
+def _update_series(filename, old_periods, indexes, dropped, added, path):
+    # Update the series of a single path: drop the periods that are gone or changed, and add the ones that are new.
+    old = _read_json(filename, {"families": {}})
+    series = {}
+
+    for family, values in old["families"].items():
+        for value, points in values.items():
+            points = [
+                [indexes[old_periods[index]], share]
+                for index, share in points
+                if index < len(old_periods) and old_periods[index] not in dropped
+            ]
+            if points:
+                series.setdefault(family, {})[value] = points
+
+    for period, families in added.items():
+        for family, data in families.items():
+            for value, amount in data["values"].get(path, {}).items():
+                points = series.setdefault(family, {}).setdefault(value, [])
+                points.append([indexes[period], get_share(amount, data["seconds"])])
+
+    if not series:
+        if os.path.exists(filename):
+            os.unlink(filename)
+        return False
+
+    # Sorted, so the result is the same however many runs the trends were built in.
+    series = {
+        family: {value: sorted(points) for value, points in sorted(values.items())}
+        for family, values in sorted(series.items())
+    }
+    _write_json(filename, {"format": TRENDS_FORMAT, "families": series})
+    return True
+
+
+def _update_timeframe(directory, timeframe, periods, changed, removed):
+    index_filename = os.path.join(directory, timeframe, "index.json")
+    latest_filename = os.path.join(directory, timeframe, "latest.json")
+    movers_filename = os.path.join(directory, timeframe, "movers.json")
+    old = _read_json(index_filename, {"periods": [], "paths": [], "seconds": {}})
+
+    new_periods = sorted(period for period in periods if get_timeframe(period) == timeframe)
+    indexes = {period: index for index, period in enumerate(new_periods)}
+    dropped = set(changed) | set(removed)
+    added = {period: get_family_seconds(_load_survey(periods[period])) for period in sorted(changed)}
+
+    # The series refer to periods by their index in the index of the timeframe; remove it while they are updated.
+    # If this run doesn't finish, the next one finds no index, and rebuilds the timeframe from scratch.
+    if os.path.exists(index_filename):
+        os.unlink(index_filename)
+
+    paths = dict.fromkeys(old["paths"])
+    for families in added.values():
+        for data in families.values():
+            paths.update(dict.fromkeys(data["values"]))
+
+    paths = [
+        path
+        for path in paths
+        if _update_series(get_path_filename(directory, timeframe, path), old["periods"], indexes, dropped, added, path)
+    ]
+
+    seconds = {}
+    for family, points in old["seconds"].items():
+        for index, amount in points:
+            if old["periods"][index] not in dropped:
+                seconds.setdefault(family, []).append([indexes[old["periods"][index]], amount])
+    for period, families in added.items():
+        for family, data in families.items():
+            seconds.setdefault(family, []).append([indexes[period], data["seconds"]])
+    seconds = {family: sorted(points) for family, points in sorted(seconds.items())}
+
+    def get_raw(period):
+        if period in added:
+            return added[period]
+        return get_family_seconds(_load_survey(periods[period]))
+
+    latest = {"period": None, "families": {}}
+    if new_periods:
+        latest = {"period": new_periods[-1], "families": get_raw(new_periods[-1])}
+
+    movers = {"latest": None, "previous": None, "families": {}}
+    if len(new_periods) > 1:
+        movers["latest"], movers["previous"] = new_periods[-1], new_periods[-2]
+        movers["families"] = get_family_movers(get_shares(latest["families"]), get_shares(get_raw(new_periods[-2])))
+
+    _write_json(latest_filename, {"format": TRENDS_FORMAT, **latest})
+    _write_json(movers_filename, {"format": TRENDS_FORMAT, **movers})
+    _write_json(
+        index_filename,
+        {"format": TRENDS_FORMAT, "periods": new_periods, "paths": sorted(paths), "seconds": seconds},
+    )
+
+
+def update_trends(directory, sources):
+    # Bring the trends up to date with the summaries in the sources; only new or changed summaries are read.
+    # Returns the periods that were (re)read.
+    manifest_filename = os.path.join(directory, "index.json")
+    manifest = _read_json(manifest_filename, {"format": TRENDS_FORMAT, "periods": {}})
+
+    periods = find_periods(sources)
+    hashes = {period: _hash_file(filename) for period, filename in periods.items()}
+
+    # A timeframe without an index is (re)built from scratch; see _update_timeframe.
+    rebuild = {
+        get_timeframe(period)
+        for period in hashes
+        if not os.path.exists(os.path.join(directory, get_timeframe(period), "index.json"))
+    }
+    changed = [
+        period
+        for period, sha256 in hashes.items()
+        if manifest["periods"].get(period) != sha256 or get_timeframe(period) in rebuild
+    ]
+    removed = [period for period in manifest["periods"] if period not in hashes]
+
+    for timeframe in sorted({get_timeframe(period) for period in changed + removed}):
+        _update_timeframe(
+            directory,
+            timeframe,
+            periods,
+            [period for period in changed if get_timeframe(period) == timeframe],
+            [period for period in removed if get_timeframe(period) == timeframe],
+        )
+
+    # The manifest is written last; if anything before failed, the next run reads the same summaries again.
+    if changed or removed:
+        manifest["periods"] = hashes
+        _write_json(manifest_filename, manifest)
+
+    return sorted(changed)
+
+
+def get_movers(directory, timeframe, family, top):
+    # The values of which the share changed most between the two most recent periods, if reported in both.
+    data = _read_json(os.path.join(directory, timeframe, "movers.json"))
+    if data is None:
+        return []
+    return [tuple(mover) for mover in data["families"].get(family, [])[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.trends", description="Keep a compact history of every value of every path."
+    )
+    parser.add_argument(
+        "--output", metavar="DIR", default="_trends", help="Where the trends are kept (default: _trends)."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update = subparsers.add_parser("update", help="Add new or changed summaries to the trends.")
+    update.add_argument(
+        "sources",
+        nargs="*",
+        default=["_data/summaries", "_shards"],
+        help="Directories with summaries, as <year>/<name>.json or shards (default: _data/summaries _shards).",
+    )
+
+    movers = subparsers.add_parser("movers", help="Print the values that changed most in the most recent period.")
+    movers.add_argument("timeframe", help="Timeframe, like wk or q.")
+    movers.add_argument("family", help="Family of versions, like 14 or jgrpp.")
+    movers.add_argument(
+        "--top", type=int, default=20, help=f"Amount of values to print, at most {MOVERS_KEPT} (default: 20)."
+    )
+    args = parser.parse_args()
+
+    if args.command == "update":
+        for period in update_trends(args.output, args.sources):
+            print(period)
+    elif args.command == "movers":
+        for path, value, previous, latest in get_movers(args.output, args.timeframe, args.family, args.top):
+            print(f"{path} = {value}: {previous}% -> {latest}% ({latest - previous:+.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import tarfile
+import time
+
+from collections import defaultdict
+
+from analysis.store import new_summary
+from analysis.summarize import BLACKLIST_PATHS, summarize_settings
+from analysis.windows_name import WINDOWS_BUILD_NUMBER_TO_NAME
+
+# Survey results covering the corner cases of summarizing settings, on top of whatever packs are given.
+EDGE_CASES = [
+    {
+        "info": {
+            "plugins": [],
+            "font": {"small": ["a", "b"], "medium": '""', "large": '"Arial"'},
+            "os": {"os": "Windows", "release": "10.0.22631 ()", "machine": "x86_64"},
+            "configuration": {"video_info": "sdl (2.0)", "graphics_set": "OpenGFX.7", "sound_set": "NoSound"},
+        },
+        "game": {"settings": {"display_opt": "", "resolution": "1920x1080", "flag": True, "nothing": None}},
+    },
+    {
+        "info": {
+            "plugins": {
+                "social": [{"state": "failed", "version": "1"}],
+                "other": [{"state": "running", "version": "2"}],
+            },
+            "os": {"os": "MacOS", "release": "10.15.7"},
+            "configuration": {"video_info": "sdl-opengl (2.28.5) (Apple M1, 4.1 Metal - 83.1)"},
+        },
+        "game": {"settings": {"extra_display_opt": "A|B|A", "resolution": "800,600", "ratio": 1.5}},
+    },
+    {
+        "info": {
+            "os": {"os": "Linux", "release": "6.5.0-14-generic"},
+            "configuration": {"video_info": "opengl (Intel(R) UHD Graphics 620, 4.6.0 - Build 31.0.101.2111)"},
+        },
+        "game": {"settings": {"display_opt": "SHOW_SIGNS", "music": {"music_vol": 1, "playlist": '"all"'}}},
+    },
+]
+
+
+# The original (recursive) implementation, to compare against.
+def reference_summarize_setting(summary, version, seconds, path, data):
+    if path in BLACKLIST_PATHS:
+        return
+
+    if type(data) is dict:
+        for key, value in data.items():
+            # Combine info.os.os with info.os.release, as their whole is the OS version.
+            if path == "info.os" and key == "os":
+                reference_summarize_setting(summary, version, seconds, f"{path}.vendor", value)
+                value = f"{value} {data['release']}".replace(" ()", "").split("-")[0]
+
+            reference_summarize_setting(summary, version, seconds, f"{path}.{key}", value)
+
+        return
+
+    # Broken data from the early days.
+    if path == "info.plugins":
+        return
+
+    # Only track plugins if they are running.
+    if path.startswith("info.plugins"):
+        for entry in data:
+            if entry["state"] == "running":
+                data = entry["version"]
+                break
+        else:
+            data = "(not running)"
+
+    if type(data) is list:
+        # Fonts were of type list in OpenTTD starting with nightly 20251207.
+        # This was reverted in nightly 20251214.
+        # Once support for lists is added, this temporary workaround can be removed.
+        if path.startswith("info.font."):
+            return
+        raise Exception("Lists are not implemented yet")
+
+    if path in ("game.settings.display_opt", "game.settings.extra_display_opt"):
+        if not data:
+            return
+
+        for option in data.split("|"):
+            reference_summarize_setting(summary, version, seconds, f"{path}.{option}", "true")
+        return
+
+    if path == "info.configuration.video_info":
+        if "(" not in data or data.startswith("sdl "):
+            data = "(no hardware acceleration)"
+            reference_summarize_setting(summary, version, seconds, f"{path}.brand", data)
+        else:
+            driver = data.split("(")[0].strip()
+
+            # SDL reports slightly different from the rest.
+            if driver == "sdl-opengl":
+                data = data.split("(", 2)[2]
+            else:
+                data = data.split("(", 1)[1]
+
+            # Only keep the graphics driver name; remove all versions etc.
+            data = data.replace("(TM)", "@TM@").replace("(R)", "@R@").replace("(C)", "@C@")
+            data = data.split(",")[0].split("(")[0].strip()
+            data = data.replace("@TM@", "(TM)").replace("@R@", "(R)").replace("@C@", "(C)")
+
+            if "nvidia" in data.lower() or "geforce" in data.lower() or "quadro" in data.lower():
+                brand = "NVIDIA"
+            elif "intel" in data.lower():
+                brand = "Intel"
+            elif "amd " in data.lower() or "radeon" in data.lower():
+                brand = "AMD"
+            elif "apple" in data.lower():
+                brand = "Apple"
+            else:
+                brand = "(other)"
+
+            reference_summarize_setting(summary, version, seconds, f"{path}.brand", brand)
+
+    if path == "game.settings.resolution":
+        width, _, height = data.partition(",")
+        if width and height and width.isdigit() and height.isdigit():
+            reference_summarize_setting(summary, version, seconds, f"{path}.width", int(width))
+            reference_summarize_setting(summary, version, seconds, f"{path}.height", int(height))
+        else:
+            # We failed to split in width/height, so record unknowns.
+            reference_summarize_setting(summary, version, seconds, f"{path}.width", "(unknown)")
+            reference_summarize_setting(summary, version, seconds, f"{path}.height", "(unknown)")
+
+    if path == "info.os.os":
+        if data.startswith("Windows"):
+            major, minor, buildnumber = data.split(" ")[1].split(".")
+            os_version = WINDOWS_BUILD_NUMBER_TO_NAME.get(f"{major}.{minor}", data)
+            if major == "10" and buildnumber.isdigit() and int(buildnumber) >= 22000:
+                os_version = WINDOWS_BUILD_NUMBER_TO_NAME.get(f"{major}.{minor}.22000", os_version)
+        elif data.startswith("MacOS"):
+            major, minor, patch = data.split(" ", 1)[1].split(".")
+            if major.isdigit() and int(major) <= 10:
+                os_version = f"MacOS {major}.{minor}"
+            else:
+                os_version = f"MacOS {major}"
+        elif data.startswith("Linux"):
+            os_version = "Linux"
+        else:
+            os_version = data
+
+        reference_summarize_setting(summary, version, seconds, f"{path}.version", os_version)
+
+    if path in ("info.configuration.graphics_set", "info.configuration.music_set", "info.configuration.sound_set"):
+        content, _, content_version = data.partition(".")
+        path = f"{path}.{content}"
+        data = content_version
+
+    if type(data) is str:
+        if data.startswith('"') and data.endswith('"'):
+            data = data[1:-1]
+        if not data:
+            data = "(empty)"
+
+    summary[version][path][data] += seconds
+
+
+def load_surveys(filenames):
+    surveys = list(EDGE_CASES)
+
+    for filename in filenames:
+        with tarfile.open(filename) as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith("verified.json"):
+                    with archive.extractfile(member) as fp:
+                        surveys.append(json.loads(fp.read()))
+
+    return surveys
+
+
+def run_reference(surveys):
+    summary = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for data in surveys:
+        for key, value in data.items():
+            reference_summarize_setting(summary, "version", 100, key, value)
+    return summary
+
+
+def run_compiled(surveys):
+    summary = new_summary()
+    for data in surveys:
+        summarize_settings(summary, "version", 100, data)
+    return summary
+
+
+def measure(func, surveys, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(surveys)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best / len(surveys) * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.flatten",
+        description="Compare summarizing the settings of each survey against the original recursive implementation.",
+    )
+    parser.add_argument("filenames", nargs="*", help="Survey packs (tar.xz) to add to the built-in corner cases.")
+    args = parser.parse_args()
+
+    surveys = load_surveys(args.filenames)
+
+    # Both should result in the same summary, including the order in which paths and values were added.
+    reference = run_reference(surveys)
+    compiled = run_compiled(surveys)
+    if [(path, list(data.items())) for path, data in reference["version"].items()] != [
+        (path, list(data.items())) for path, data in compiled["version"].export().items()
+    ]:
+        raise Exception("Summarizing settings results in a different summary than the reference")
+
+    reference_time = measure(run_reference, surveys, 5)
+    compiled_time = measure(run_compiled, surveys, 5)
+
+    print(f"Surveys: {len(surveys)}")
+    print(f"Reference: {reference_time:.2f} us/survey")
+    print(f"Compiled: {compiled_time:.2f} us/survey")
+    print(f"Speedup: {reference_time / compiled_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
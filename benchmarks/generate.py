@@ -0,0 +1,244 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import tarfile
+
+# Versions with their relative weight; this includes versions that are rejected, as the real survey has those too.
+VERSIONS = [
+    ("14.1", 30),
+    ("14.0", 10),
+    ("14.0-beta1", 3),
+    ("13.4", 1),
+    ("jgrpp-0.57.1", 8),
+    ("20240301-master-g1234abcd", 6),
+    ("20240101-master-g1234abcd", 2),
+    ("20240301-feature-g1234abcd", 2),
+]
+# NewGRFs as (grf-id, md5sum, set); only part of them is on the fake BaNaNaS.
+GRFS = [(f"4d656f{i:02x}", f"{i * 7919:08x}", ["train", "road", "station", "industry"][i % 4]) for i in range(60)]
+GRFS_ON_BANANAS = 45
+# AIs and GameScripts; only part of them is on the fake BaNaNaS.
+AIS = ["AdmiralAI", "SimpleAI", "CivilAI", "Hoge", "Unknown Thing", "DummyAI"]
+AIS_ON_BANANAS = 4
+GAME_SCRIPTS = ["MinimalGS", "Renewed Village Growth", "Private GS"]
+GAME_SCRIPTS_ON_BANANAS = 2
+
+DISPLAY_OPTS = [
+    "SHOW_TOWN_NAMES|SHOW_STATION_NAMES|SHOW_SIGNS|FULL_ANIMATION|FULL_DETAIL|WAYPOINTS|SHOW_COMPETITOR_SIGNS",
+    "SHOW_TOWN_NAMES|SHOW_STATION_NAMES|SHOW_SIGNS|FULL_ANIMATION|FULL_DETAIL",
+    "SHOW_SIGNS",
+    "",
+]
+EXTRA_DISPLAY_OPTS = ["", "SHOW_WAYPOINT_NAMES", "SHOW_WAYPOINT_NAMES|SHOW_DEPOT_NAMES"]
+VIDEO_INFO = [
+    "opengl (NVIDIA GeForce GTX 1060/PCIe/SSE2, 4.6.0 NVIDIA 531.79)",
+    "opengl (NVIDIA GeForce RTX 3070/PCIe/SSE2, 4.6.0 NVIDIA 546.33)",
+    "opengl (Intel(R) UHD Graphics 620, 4.6.0 - Build 31.0.101.2111)",
+    "opengl (AMD Radeon RX 580 (radeonsi, polaris10, LLVM 15.0.7), 4.6 (Core Profile))",
+    "sdl-opengl (2.28.5) (Apple M1, 4.1 Metal - 83.1)",
+    "sdl (2.28.5)",
+    "win32",
+    "opengl (llvmpipe (LLVM 15.0.7, 256 bits), 4.5 (Core Profile))",
+]
+OPERATING_SYSTEMS = [
+    ("Windows", "10.0.19045 ()"),
+    ("Windows", "10.0.22631 ()"),
+    ("Windows", "6.1.7601 (Service Pack 1)"),
+    ("MacOS", "10.15.7"),
+    ("MacOS", "14.2.1"),
+    ("Linux", "6.5.0-14-generic"),
+    ("FreeBSD", "14.0-RELEASE"),
+]
+RESOLUTIONS = ["1920,1080", "1920,1080", "2560,1440", "1280,720", "3840,2160", "x"]
+# The state of a survey result in the pack, with its relative weight; only "verified" results are analysed.
+STATES = [("verified", 90), ("unknown", 7), ("invalid", 3)]
+
+
+def _weighted(rng, choices):
+    return rng.choices([choice for choice, _ in choices], weights=[weight for _, weight in choices])[0]
+
+
+def _bananas_id(content_type, index):
+    return f"{0x41000000 + index * 17 + len(content_type):08x}"
+
+
+def generate_bananas(folder):
+    # A tiny BaNaNaS tree, in the same layout as the real one.
+    def write(filename, content):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            f.write(content)
+
+    for grf_id, md5sum, set in GRFS[:GRFS_ON_BANANAS]:
+        base = f"{folder}/newgrf/{grf_id}"
+        write(f"{base}/global.yaml", f"name: GRF {grf_id}\n")
+        write(f"{base}/authors.yaml", "authors:\n- name: someone\n")
+        for version in range(3):
+            write(
+                f"{base}/versions/{version}.yaml",
+                f"version: '{version + 1}.0'\nmd5sum-partial: '{md5sum[:7]}{version}'\nclassification:\n  set: {set}\n",
+            )
+
+    for content_type, names in (
+        ("ai", AIS[:AIS_ON_BANANAS]),
+        ("game-script", GAME_SCRIPTS[:GAME_SCRIPTS_ON_BANANAS]),
+    ):
+        for index, name in enumerate(names):
+            base = f"{folder}/{content_type}/{_bananas_id(content_type, index)}"
+            # BaNaNaS has "Hoge AI", while the game reports "Hoge".
+            write(f"{base}/global.yaml", f"name: '{name}{' AI' if name == 'Hoge' else ''}'\n")
+            write(f"{base}/authors.yaml", "authors:\n- name: someone\n")
+
+
+def generate_survey(rng, date):
+    version = _weighted(rng, VERSIONS)
+    schema = 1 if rng.random() < 0.1 else 2
+    # Most savegames are seen once, but some are seen often.
+    session_id = f"{rng.getrandbits(128):032x}" if rng.random() < 0.8 else f"{rng.randrange(400):032x}"
+
+    seconds = int(rng.expovariate(1 / 3000))
+    if rng.random() < 0.01:
+        # Older clients could report a unix timestamp as seconds.
+        seconds = 1700000000
+    ticks = seconds * 30 if rng.random() < 0.9 else 50
+
+    grfs = {}
+    for _ in range(rng.choice([0, 0, 2, 5, 10, 30])):
+        grf_id, md5sum, _ = rng.choice(GRFS)
+        grfs[grf_id] = {
+            "md5sum": (md5sum[:7] + str(rng.randrange(4))).upper() + "0" * 24,
+            "status": rng.choice(["activated", "activated", "not_found"]),
+        }
+
+    companies = {}
+    for company in range(rng.choice([0, 1, 3, 8])):
+        if rng.random() < 0.5:
+            companies[str(company)] = {"type": "human"}
+        else:
+            companies[str(company)] = {"type": "ai", "script": f"{rng.choice(AIS)}.{rng.randrange(1, 30)}"}
+
+    os_name, os_release = rng.choice(OPERATING_SYSTEMS)
+
+    data = {
+        "schema": schema,
+        "key": "benchmark",
+        "date": f"{date} {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+        "game": {
+            "timers": {"ticks": ticks},
+            "companies": companies if companies or rng.random() < 0.8 else None,
+            "game_script": rng.choice([None, None, f"{rng.choice(GAME_SCRIPTS)}.{rng.randrange(1, 5)}"]),
+            "grfs": grfs if grfs or rng.random() < 0.5 else None,
+            "settings": {
+                "display_opt": rng.choice(DISPLAY_OPTS),
+                "extra_display_opt": rng.choice(EXTRA_DISPLAY_OPTS),
+                "resolution": rng.choice(RESOLUTIONS + [f"{rng.randrange(640, 4000)},{rng.randrange(480, 2200)}"]),
+                "game_creation": {
+                    "generation_seed": rng.getrandbits(31),
+                    "landscape": rng.choice(["temperate", "arctic", "tropic", "toyland"]),
+                    "map_x": rng.choice([6, 7, 8, 9, 10]),
+                    "map_y": rng.choice([6, 7, 8, 9, 10]),
+                    "town_name": '"english"',
+                },
+                "gui": {
+                    "autosave": rng.choice(["monthly", "off", "yearly"]),
+                    "zoom_min": rng.randrange(0, 3),
+                    "fast_forward": rng.random() < 0.5,
+                    "scrollwheel_multiplier": rng.randrange(1, 10),
+                },
+                "construction": {f"setting_{index}": rng.randrange(4) for index in range(40)},
+                "vehicle": {f"setting_{index}": rng.random() < 0.5 for index in range(40)},
+                "music": {"music_vol": rng.randrange(128), "effect_vol": rng.randrange(128)},
+                "player_face": rng.getrandbits(31),
+                "small_font": "Arial",
+            },
+        },
+        "info": {
+            "openttd": {"version": {"revision": version, "hash": "1234abcd"}, "build_date": "Jan  1 2024"},
+            "os": {"os": os_name, "release": os_release, "machine": "x86_64", "version": "x"},
+            "configuration": {
+                "video_info": rng.choice(VIDEO_INFO),
+                "graphics_set": rng.choice(["OpenGFX.7", "OpenGFX.7", "original_windows.1", "zbase.5"]),
+                "music_set": rng.choice(["OpenMSX.1", "NoMusic.0"]),
+                "sound_set": rng.choice(["OpenSFX.1", "NoSound.0"]),
+                "network": rng.choice(["no", "no", "server", "client"]),
+                "language": rng.choice(["english.lng", "german.lng", "dutch.lng"]),
+            },
+            "font": {"small": rng.choice(["", "Arial", "DejaVu Sans"]), "medium": ""},
+            "compiler": "gcc",
+        },
+    }
+
+    if rng.random() < 0.3:
+        data["info"]["plugins"] = {
+            "social": [
+                {"state": rng.choice(["running", "failed"]), "name": "discord", "version": f"1.{rng.randrange(3)}"}
+            ]
+        }
+
+    if schema == 1:
+        data["id"] = session_id
+        data["game"]["timers"]["seconds"] = seconds
+    else:
+        data["session"] = {"id": session_id, "seconds": seconds}
+        if rng.random() < 0.7:
+            data["session"]["savegame_size"] = int(rng.lognormvariate(13, 1.2))
+
+    return session_id, data
+
+
+def generate_pack(filename, date, count, seed):
+    rng = random.Random(seed)
+
+    with tarfile.open(filename, "w:xz") as archive:
+        for index in range(count):
+            session_id, data = generate_survey(rng, date)
+            state = _weighted(rng, STATES)
+
+            raw = json.dumps(data).encode()
+            seconds = index * 86400 // count
+            info = tarfile.TarInfo(
+                f"{date}/{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{index % 1000:03d}Z"
+                f"-{session_id}.{state}.json"
+            )
+            info.size = len(raw)
+            archive.addfile(info, io.BytesIO(raw))
+
+
+def generate(folder, surveys, packs, seed=0):
+    # Generate "packs" daily survey packs with "surveys" survey results in total, and the BaNaNaS they refer to.
+    # The same arguments always result in the same packs.
+    os.makedirs(folder, exist_ok=True)
+    generate_bananas(f"{folder}/BaNaNaS")
+
+    filenames = []
+    start = datetime.date(2024, 3, 1)
+    for pack in range(packs):
+        date = (start + datetime.timedelta(days=pack)).isoformat()
+        filename = f"{folder}/openttd-survey-pack.{date}.tar.xz"
+        count = surveys // packs + (1 if pack < surveys % packs else 0)
+
+        generate_pack(filename, date, count, seed * 1000 + pack)
+        filenames.append(filename)
+
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.generate", description="Generate synthetic survey packs to benchmark with."
+    )
+    parser.add_argument("folder", help="Folder to write the survey packs and the BaNaNaS tree to.")
+    parser.add_argument("--surveys", type=int, default=10000, help="Total amount of survey results (default: 10000).")
+    parser.add_argument("--packs", type=int, default=7, help="Amount of daily packs (default: 7).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator (default: 0).")
+    args = parser.parse_args()
+
+    for filename in generate(args.folder, args.surveys, args.packs, args.seed):
+        print(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis.decode import DECODER_NAME, decode
+from analysis.finalize import finalize_summary
+from analysis.reader import read_archive
+from analysis.store import export_summary, new_summary
+from analysis.summarize import summarize_result, summarize_settings
+
+from .generate import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _in_fresh_process(func, *args):
+    # Nothing (like the BaNaNaS cache) is warm from earlier measurements this way. It also keeps this process small:
+    # on Linux a child starts with the peak RSS of its parent, which would otherwise end up in the measurements.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(func, *args).result()
+
+
+def prepare(data_dir, surveys, packs, seed):
+    # Generating is slow for bigger sizes; reuse earlier generated packs with the same arguments.
+    folder = os.path.abspath(os.path.join(data_dir, f"{surveys}-{packs}-{seed}"))
+    if not os.path.exists(f"{folder}/complete"):
+        _in_fresh_process(generate, folder, surveys, packs, seed)
+        open(f"{folder}/complete", "w").close()
+
+    return folder, sorted(glob.glob(f"{folder}/*.tar.xz"))
+
+
+def measure_stages(folder, filenames, timeframe):
+    os.chdir(folder)
+
+    stages = defaultdict(float)
+    summary = new_summary()
+    settings = new_summary()
+    count = 0
+
+    for filename in filenames:
+        start = time.perf_counter()
+        for raw in read_archive(filename):
+            stages["read"] += time.perf_counter() - start
+            count += 1
+
+            # Decoding and flattening on their own, for every survey result ...
+            start = time.perf_counter()
+            data = decode(raw)
+            stages["decode"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            summarize_settings(settings, "benchmark", 100, data)
+            stages["flatten"] += time.perf_counter() - start
+
+            # ... and everything summarize_result does, which also rejects survey results.
+            start = time.perf_counter()
+            summarize_result(summary, timeframe, raw)
+            stages["aggregate"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+
+    start = time.perf_counter()
+    finalize_summary(export_summary(summary))
+    stages["finalize"] += time.perf_counter() - start
+
+    stages["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return count, dict(stages)
+
+
+def measure_run(folder, filenames, timeframe, extra_args):
+    # Time a whole run of the analysis, the same way the workflows run it.
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    command = [sys.executable, "-m", "analysis", timeframe, *extra_args, *filenames]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=folder, env=env, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    duration = time.perf_counter() - start
+
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise Exception(f"Analysis failed on {folder}")
+
+    # With --jobs, this is the peak RSS of the biggest process, not of all processes together.
+    return {
+        "seconds": duration,
+        "peak_rss_kb": rusage.ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmark the analysis.")
+    parser.add_argument(
+        "--surveys", type=int, nargs="+", default=[10000], help="Amount of survey results to benchmark with."
+    )
+    parser.add_argument("--packs", type=int, default=7, help="Amount of daily packs to spread them over (default: 7).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator (default: 0).")
+    parser.add_argument("--timeframe", choices=["wk", "q"], default="q", help="Timeframe to summarize (default: q).")
+    parser.add_argument(
+        "--data",
+        default=os.path.join(tempfile.gettempdir(), "survey-benchmark"),
+        help="Folder for the generated packs; they are reused between runs.",
+    )
+    parser.add_argument("--output", help="File to write the results to, as JSON (default: stdout).")
+    parser.add_argument("extra_args", nargs="*", help="Extra arguments for the analysis, like: -- --jobs 4")
+    args = parser.parse_args()
+
+    results = {
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "decoder": DECODER_NAME,
+        "timeframe": args.timeframe,
+        "extra_args": args.extra_args,
+        "results": [],
+    }
+
+    for surveys in args.surveys:
+        folder, filenames = prepare(args.data, surveys, args.packs, args.seed)
+
+        verified, stages = _in_fresh_process(measure_stages, folder, filenames, args.timeframe)
+        run = measure_run(folder, filenames, args.timeframe, args.extra_args)
+        run["surveys_per_second"] = verified / run["seconds"]
+
+        results["results"].append(
+            {"surveys": surveys, "verified": verified, "packs": args.packs, "stages": stages, "run": run}
+        )
+        print(
+            f"{surveys} surveys: {run['seconds']:.2f}s, {run['surveys_per_second']:.0f} surveys/s, "
+            f"peak RSS {run['peak_rss_kb'] // 1024} MiB",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import os
+import tempfile
+import threading
+
+from analysis import reader, s3
+from analysis.cache import _get_cache_key
+from analysis.reader import read_archive
+
+
+class FakeS3:
+    # Just enough of a boto3 S3 client to serve survey packs from memory, recording every request.
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.heads = []
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        self.heads.append(Key)
+        data = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "ETag": f'"{len(data):x}-{hash(data) & 0xFFFFFFFF:08x}"'}
+
+    def get_object(self, Bucket, Key, Range):
+        start, _, end = Range[len("bytes=") :].partition("-")
+        self.ranges.append((Key, int(start), int(end)))
+        return {"Body": _Body(self.objects[(Bucket, Key)][int(start) : int(end) + 1])}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {
+            "Contents": [{"Key": key} for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix)]
+        }
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+def _install(objects):
+    client = FakeS3(objects)
+    s3.reset_s3_client()
+    s3._CLIENT = client
+    s3._OBJECTS.clear()
+    return client
+
+
+def _check(condition, message):
+    if not condition:
+        raise Exception(message)
+    print(f"OK: {message}")
+
+
+def _check_abandoned(objects, filename, url, name):
+    # Stop reading after the first survey result, like when the analysis fails half-way.
+    with tempfile.TemporaryDirectory() as cache_dir:
+        s3.set_s3_cache_dir(cache_dir)
+        _install(objects)
+        threads = threading.active_count()
+
+        results = read_archive(url)
+        next(results)
+        results.close()
+
+        with open(filename, "rb") as fp:
+            data = fp.read()
+
+        # Depending on how far ahead it was downloaded, the pack might have been read completely already; either there
+        # is no copy, or an exact one.
+        copies = []
+        for entry in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, entry), "rb") as fp:
+                copies.append((entry, fp.read()))
+        _check(
+            all(not entry.endswith(".tmp") and copy == data for entry, copy in copies),
+            f"an abandoned read keeps no partial copy ({name}, {len(copies)} complete copies)",
+        )
+        _check(threading.active_count() == threads, f"an abandoned read leaves no threads behind ({name})")
+
+    s3.set_s3_cache_dir(None)
+
+
+def check(filenames, chunk_size):
+    objects = {}
+    urls = {}
+    for filename in filenames:
+        key = f"prod/{os.path.basename(filename)}"
+        with open(filename, "rb") as fp:
+            objects[("packs", key)] = fp.read()
+        urls[filename] = f"s3://packs/{key}"
+
+    s3.S3_CHUNK_SIZE = chunk_size
+    decompressors = reader.DECOMPRESSORS
+
+    for name, reader.DECOMPRESSORS in (("external decompressor", decompressors), ("tarfile", [])):
+        if name != "tarfile" and not any(reader.shutil.which(command[0]) for command in decompressors):
+            continue
+
+        for filename, url in urls.items():
+            client = _install(objects)
+            _check(list(read_archive(url)) == list(read_archive(filename)), f"{url} reads the same ({name})")
+
+            size = len(objects[("packs", url[len("s3://packs/") :])])
+            ranges = sorted((start, end) for _, start, end in client.ranges)
+            _check(
+                len(ranges) > 1 and ranges[0][0] == 0 and ranges[-1][1] == size - 1,
+                f"{url} is read in {len(ranges)} ranged GETs ({name})",
+            )
+            _check(
+                all(previous[1] + 1 == current[0] for previous, current in zip(ranges, ranges[1:])),
+                f"ranges of {url} are contiguous ({name})",
+            )
+
+            _check_abandoned(objects, filename, url, name)
+    reader.DECOMPRESSORS = decompressors
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        s3.set_s3_cache_dir(cache_dir)
+        filename, url = next(iter(urls.items()))
+
+        client = _install(objects)
+        _get_cache_key("wk", url)
+        expected = list(read_archive(url))
+        _check(len(client.heads) == 1, f"{url} is asked for once for both the cache key and the download")
+
+        copies = [entry for entry in os.listdir(cache_dir)]
+        with open(filename, "rb") as fp, open(os.path.join(cache_dir, copies[0]), "rb") as copy:
+            _check(len(copies) == 1 and fp.read() == copy.read(), "--s3-cache keeps an exact copy")
+
+        client = _install(objects)
+        _check(list(read_archive(url)) == expected and not client.ranges, "a cached copy is read without any GET")
+
+    s3.set_s3_cache_dir(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.s3", description="Check reading survey packs from S3 against a fake S3 client."
+    )
+    parser.add_argument(
+        "filenames", nargs="*", help="Survey packs (tar.xz) to serve; without, a few small packs are generated."
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=64 * 1024, help="Size of a ranged GET, small to get many (default: 65536)."
+    )
+    args = parser.parse_args()
+
+    if args.filenames:
+        check(args.filenames, args.chunk_size)
+        return
+
+    from .generate import generate
+
+    with tempfile.TemporaryDirectory() as folder:
+        check(generate(folder, 3000, 2), args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
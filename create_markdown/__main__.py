@@ -101,6 +101,16 @@ def main():
         raise ValueError("Timeframe must be 'q' or 'wk'")
 
     create_summary(timeframe, year, week, start_date, end_date)
+
+    # Sharded summaries (see analysis.shards) have an index, so the versions can be found without loading them.
+    index = f"_shards/{year}/{timeframe}{week}/index.json"
+    if os.path.exists(index):
+        with open(index, "r") as file:
+            data = json.load(file)
+            for version in data["versions"]:
+                create_version(timeframe, year, week, start_date, end_date, version)
+        return
+
     with open(f"_data/summaries/{year}/{timeframe}{week}.json", "r") as file:
         data = json.load(file)
         for version, content in data["survey"].items():